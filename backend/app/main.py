@@ -1,7 +1,10 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
 
 from backend.app.routes.auth import router as auth_router
 from backend.app.routes.chat import router as chat_router
@@ -11,12 +14,91 @@ from backend.app.routes.dashboard import router as dashboard_router
 from backend.app.routes.plans import router as plans_router
 from backend.app.routes.payments import router as payment_router
 from backend.app.routes.pricing import router as pricing_router
+from backend.app.services.ingestion import ingestion_workers
+from backend.app.services.chat_agent import get_chat_engine
+from backend.app.services.browser_pool import browser_pool
+from backend.app.utils.config import MAX_UPLOAD_SIZE_MB
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared chat engine up front so the first chat request doesn't pay for it
+    try:
+        get_chat_engine()
+    except Exception as e:
+        print(f"Could not initialise chat engine at startup: {e}")
+    # Headless browsers for scraping are shared by all crawls and started on first use
+    browser_pool.start()
+    # Background workers that process queued knowledge base ingestion jobs
+    ingestion_workers.start()
+    yield
+    await ingestion_workers.stop()
+    await browser_pool.close()
 
-app = FastAPI(title="Chatbot SaaS")
+app = FastAPI(title="Chatbot SaaS", lifespan=lifespan)
 
 # Serve static files
 app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 
+class _BodyTooLarge(BaseException):
+    """Unwinds the app once an upload passes the limit (not an Exception, so no handler turns it into a 400)"""
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Refuses knowledge base uploads larger than the upload limit with a 413
+    while they are being received: at once when the declared Content-Length
+    is too large, otherwise as soon as the body read so far passes the limit,
+    at which point the route is stopped.
+    """
+
+    def __init__(self, app, path: str = "/knowledgebase/add",
+                 max_bytes: int = int(MAX_UPLOAD_SIZE_MB * 1024 * 1024) + 64 * 1024):
+        # Allow some room for the multipart form fields around the file
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        too_large = JSONResponse(
+            status_code=413,
+            content={"detail": f"File is too large. The maximum upload size is {MAX_UPLOAD_SIZE_MB:g} MB."}
+        )
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await too_large(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await too_large(scope, receive, send)
+
+
+# Inside CORS, so that its 413 responses carry the CORS headers
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
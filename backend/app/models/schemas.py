@@ -46,9 +46,11 @@ class KnowledgeBaseResponse(BaseModel):
 # Chat schemas
 class ChatInput(BaseModel):
     user_id: str
-    knowledge_base_id: Optional[str] = None  # Made optional since chat_agent doesn't use it
+    knowledge_base_id: Optional[str] = None  # Restrict retrieval to one knowledge base
+    knowledge_base_ids: Optional[List[str]] = None  # ...or to several; both unset means all of the user's
     message: str
     chat_history: Optional[List[List[str]]] = []
+    session_id: Optional[str] = None  # Lets the server reuse the conversation summary across messages
 
 class ChatResponse(BaseModel):
     response: str
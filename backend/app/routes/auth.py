@@ -2,7 +2,8 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from backend.app.models.schemas import UserRegister, UserLogin, UserResponse, Token
 from backend.app.services.auth_service import (
-    register_user, authenticate_user, create_access_token, verify_token, get_current_user
+    register_user, authenticate_user, create_access_token, decode_token, get_current_user,
+    token_claims_for_user, user_from_claims
 )
 from datetime import timedelta
 from backend.app.utils.config import ACCESS_TOKEN_EXPIRE_MINUTES
@@ -12,14 +13,18 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 async def get_current_active_user(token: str = Depends(oauth2_scheme)):
-    email = verify_token(token)
-    if email is None:
+    payload = decode_token(token)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = await get_current_user(email)
+    # Tokens carrying the user's stable claims need no database lookup at all
+    user = user_from_claims(payload)
+    if user is not None:
+        return user
+    user = await get_current_user(payload["sub"])
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -85,7 +90,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data=token_claims_for_user(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -1,11 +1,73 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from backend.app.models.schemas import ChatInput, ChatResponse
-from backend.app.services.chat_agent import get_chat_response
-from backend.app.utils.supabase_client import supabase
+from backend.app.services.chat_agent import aget_chat_response, astream_chat_response
+from backend.app.services.entitlements import get_entitlements, subscription_end_date
 from .auth import get_current_active_user
+from typing import List, Optional
+import asyncio
+import json
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+async def _sse_stream(events):
+    """Format (event, data) pairs as Server-Sent Events"""
+    async for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _knowledge_base_scope(data: ChatInput) -> Optional[List[str]]:
+    """Knowledge bases the question is restricted to, or None for all of the user's"""
+    ids = list(data.knowledge_base_ids or [])
+    if data.knowledge_base_id and data.knowledge_base_id not in ids:
+        ids.append(data.knowledge_base_id)
+    return ids or None
+
+def _streaming_response(data: ChatInput) -> StreamingResponse:
+    events = astream_chat_response(
+        user_id=data.user_id,
+        message=data.message,
+        chat_history=data.chat_history or [],
+        knowledge_base_ids=_knowledge_base_scope(data),
+        session_id=data.session_id
+    )
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # don't let proxies buffer tokens
+    )
+
+def _ensure_public_chat_allowed(user_id: str):
+    """
+    Validate that the user_id owns active knowledge bases and has a valid subscription
+    """
+    from datetime import date
+
+    # Profile, subscription and knowledge base lookups are cached for a short TTL
+    entitlements = get_entitlements(user_id)
+
+    if not entitlements["client_id"]:
+        print(f"No client profile found for user {user_id}")
+        raise HTTPException(status_code=403, detail="User profile not found")
+
+    # Check subscription validity
+    subscription = entitlements["subscription"]
+    if subscription:
+        end_date = subscription_end_date(subscription)
+
+        if end_date < date.today():
+            print(f"Subscription expired for user {user_id}. End date: {end_date}")
+            raise HTTPException(status_code=403, detail="Subscription has expired. Please renew your subscription to continue using the chatbot.")
+    else:
+        print(f"No active subscription found for user {user_id}")
+        raise HTTPException(status_code=403, detail="No active subscription found. Please subscribe to use the chatbot.")
+
+    # Verify that the user_id exists and has active knowledge bases
+    if not entitlements["active_knowledge_base_ids"]:
+        print(f"No active knowledge bases found for user {user_id}")
+        raise HTTPException(status_code=403, detail="No active knowledge bases found for this user")
+
+    print(f"Found {len(entitlements['active_knowledge_base_ids'])} active knowledge bases")
+
 @router.post("/ask", response_model=ChatResponse)
 async def chat_with_knowledge_base(data: ChatInput, current_user: dict = Depends(get_current_active_user)):
     # Validate user
@@ -13,10 +75,12 @@ async def chat_with_knowledge_base(data: ChatInput, current_user: dict = Depends
         raise HTTPException(status_code=403, detail="Not authorized to interact with this knowledge base.")
 
     # Get chat response
-    response = get_chat_response(
+    response = await aget_chat_response(
         user_id=data.user_id,
         message=data.message,
-        chat_history=data.chat_history or []
+        chat_history=data.chat_history or [],
+        knowledge_base_ids=_knowledge_base_scope(data),
+        session_id=data.session_id
     )
 
     # print(response)
@@ -25,6 +89,17 @@ async def chat_with_knowledge_base(data: ChatInput, current_user: dict = Depends
         raise HTTPException(status_code=500, detail="Failed to generate response.")
     return ChatResponse(response=response)
 
+@router.post("/ask/stream")
+async def stream_chat_with_knowledge_base(data: ChatInput, current_user: dict = Depends(get_current_active_user)):
+    """
+    Streaming variant of /chat/ask: emits `token` events as the answer is generated,
+    then a `done` event with source documents and token usage
+    """
+    if current_user["id"] != data.user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to interact with this knowledge base.")
+
+    return _streaming_response(data)
+
 @router.post("/public/ask", response_model=ChatResponse)
 async def public_chat_with_knowledge_base(data: ChatInput):
     """
@@ -32,67 +107,37 @@ async def public_chat_with_knowledge_base(data: ChatInput):
     but validates that the user_id owns active knowledge bases and has valid subscription
     """
     print(f"Public chat request - User ID: {data.user_id}, Message: {data.message}")
-    
-    # First, check if user has a valid subscription
-    from datetime import datetime, date
-    
-    # Get client profile for the user
-    client_result = supabase.table("saas_client_profiles")\
-        .select("id")\
-        .eq("user_id", data.user_id)\
-        .execute()
-    
-    if not client_result.data:
-        print(f"No client profile found for user {data.user_id}")
-        raise HTTPException(status_code=403, detail="User profile not found")
-    
-    client_id = client_result.data[0]["id"]
-    
-    # Check subscription validity
-    sub_result = supabase.table("saas_subscriptions")\
-        .select("end_date, status")\
-        .eq("client_id", client_id)\
-        .eq("status", "active")\
-        .execute()
-    
-    if sub_result.data:
-        subscription = sub_result.data[0]
-        end_date = datetime.strptime(subscription["end_date"], "%Y-%m-%d").date() if isinstance(subscription["end_date"], str) else subscription["end_date"]
-        
-        if end_date < date.today():
-            print(f"Subscription expired for user {data.user_id}. End date: {end_date}")
-            raise HTTPException(status_code=403, detail="Subscription has expired. Please renew your subscription to continue using the chatbot.")
-    else:
-        print(f"No active subscription found for user {data.user_id}")
-        raise HTTPException(status_code=403, detail="No active subscription found. Please subscribe to use the chatbot.")
-    
-    # Verify that the user_id exists and has active knowledge bases
-    kb_result = supabase.table("saas_knowledge_base")\
-        .select("id")\
-        .eq("user_id", data.user_id)\
-        .eq("status", "active")\
-        .execute()
-    
-    if not kb_result.data:
-        print(f"No active knowledge bases found for user {data.user_id}")
-        raise HTTPException(status_code=403, detail="No active knowledge bases found for this user")
-    
-    print(f"Found {len(kb_result.data)} active knowledge bases")
-    
+
+    # First, check if user has a valid subscription and active knowledge bases
+    await asyncio.to_thread(_ensure_public_chat_allowed, data.user_id)
+
     # Get chat response
     try:
-        response = get_chat_response(
+        response = await aget_chat_response(
             user_id=data.user_id,
             message=data.message,
-            chat_history=data.chat_history or []
+            chat_history=data.chat_history or [],
+            knowledge_base_ids=_knowledge_base_scope(data),
+            session_id=data.session_id
         )
-        
+
         print(f"Chat response generated: {response[:100]}..." if response else "No response generated")
-        
+
         if not response:
             raise HTTPException(status_code=500, detail="Failed to generate response.")
-            
+
         return ChatResponse(response=response)
     except Exception as e:
         print(f"Error in public chat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+@router.post("/public/ask/stream")
+async def public_stream_chat_with_knowledge_base(data: ChatInput):
+    """
+    Streaming variant of /chat/public/ask used by the embedded widget
+    """
+    print(f"Public streaming chat request - User ID: {data.user_id}, Message: {data.message}")
+
+    await asyncio.to_thread(_ensure_public_chat_allowed, data.user_id)
+
+    return _streaming_response(data)
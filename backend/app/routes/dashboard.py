@@ -1,5 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
 from backend.app.utils.supabase_client import supabase
+from backend.app.services.answer_cache import invalidate_user_answers
+from backend.app.services.vector_store import invalidate_knowledge_base_vectors
+from backend.app.services.entitlements import get_entitlements, invalidate_entitlements
 from .auth import get_current_active_user
 from typing import List
 
@@ -15,33 +18,19 @@ async def get_dashboard_data(current_user: dict = Depends(get_current_active_use
         .eq("user_id", user_id)\
         .execute()
     
-    # Get client profile to get the correct client_id
-    client_result = supabase.table("saas_client_profiles")\
-        .select("id")\
-        .eq("user_id", user_id)\
-        .execute()
-    
     # Get user's plan details
     plan_details = {}
-    if client_result.data:
-        client_id = client_result.data[0]["id"]
-        sub_result = supabase.table("saas_subscriptions")\
-            .select("*, saas_plans(*)")\
-            .eq("client_id", client_id)\
-            .eq("status", "active")\
-            .execute()
-    
-        if sub_result.data:
-            plan = sub_result.data[0]
-            selected_plan = plan["saas_plans"]
-            plan_details = {
-                "name": selected_plan["name"],
-                "max_messages": selected_plan["max_messages"],
-                "max_sites": selected_plan["max_sites"],
-                "max_documents": selected_plan["max_documents"],
-                "can_upload_docs": selected_plan["can_upload_docs"],
-                "end_date": plan["end_date"]
-            }
+    subscription = get_entitlements(user_id)["subscription"]
+    if subscription:
+        selected_plan = subscription["saas_plans"]
+        plan_details = {
+            "name": selected_plan["name"],
+            "max_messages": selected_plan["max_messages"],
+            "max_sites": selected_plan["max_sites"],
+            "max_documents": selected_plan["max_documents"],
+            "can_upload_docs": selected_plan["can_upload_docs"],
+            "end_date": subscription["end_date"]
+        }
     
     # Generate embed code
     embed_code = f'<script src="http://localhost:8000/embed.js?id={user_id}"></script>'
@@ -86,5 +75,8 @@ async def delete_knowledge_base(kb_id: str, current_user: dict = Depends(get_cur
     
     # Delete knowledge base (cascades to vectors)
     supabase.table("saas_knowledge_base").delete().eq("id", kb_id).execute()
+    invalidate_user_answers(current_user["id"])
+    invalidate_entitlements(current_user["id"])
+    invalidate_knowledge_base_vectors(kb_id)
     
     return {"message": "Knowledge base deleted successfully"}
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Response, HTTPException
 from fastapi.responses import PlainTextResponse, JSONResponse
-from backend.app.utils.supabase_client import supabase
-from datetime import datetime, date
+from backend.app.services.entitlements import get_entitlements, subscription_end_date
+from datetime import date
 
 router = APIRouter(tags=["Embed"])
 
@@ -20,29 +20,16 @@ def check_subscription_status(user_id: str):
     Check if a user has a valid subscription for the chatbot
     """
     try:
-        # Get client profile for the user
-        client_result = supabase.table("saas_client_profiles")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .execute()
-        
-        if not client_result.data:
+        entitlements = get_entitlements(user_id)
+
+        if not entitlements["client_id"]:
             return JSONResponse(content={"valid": False, "message": "User profile not found"})
         
-        client_id = client_result.data[0]["id"]
-        
-        # Check subscription validity with plan features
-        sub_result = supabase.table("saas_subscriptions")\
-            .select("end_date, status, saas_plans(name, max_sites, max_documents, can_use_voice, can_upload_docs, branding_removed)")\
-            .eq("client_id", client_id)\
-            .eq("status", "active")\
-            .execute()
-        
-        if not sub_result.data:
+        subscription = entitlements["subscription"]
+        if not subscription:
             return JSONResponse(content={"valid": False, "message": "No active subscription found"})
         
-        subscription = sub_result.data[0]
-        end_date = datetime.strptime(subscription["end_date"], "%Y-%m-%d").date() if isinstance(subscription["end_date"], str) else subscription["end_date"]
+        end_date = subscription_end_date(subscription)
         
         if end_date < date.today():
             return JSONResponse(content={
@@ -53,13 +40,7 @@ def check_subscription_status(user_id: str):
             })
         
         # Check if user has active knowledge bases
-        kb_result = supabase.table("saas_knowledge_base")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .eq("status", "active")\
-            .execute()
-        
-        if not kb_result.data:
+        if not entitlements["active_knowledge_base_ids"]:
             return JSONResponse(content={
                 "valid": False,
                 "message": "No active knowledge bases configured",
@@ -82,7 +63,7 @@ def check_subscription_status(user_id: str):
                 "can_upload_docs": plan_info.get("can_upload_docs", False),
                 "branding_removed": plan_info.get("branding_removed", False)
             },
-            "knowledge_bases": len(kb_result.data)
+            "knowledge_bases": len(entitlements["active_knowledge_base_ids"])
         })
         
     except Exception as e:
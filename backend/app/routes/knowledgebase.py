@@ -1,12 +1,17 @@
-import asyncio
-
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
 from backend.app.models.schemas import KnowledgeBaseCreate, KnowledgeBaseResponse
-from backend.app.services.indexer import index_website_content, index_document_content
-from backend.app.services.scrapper import scrape_website_text, scrape_website_text_sync
-from backend.app.services.document_extractor import process_uploaded_file
+from backend.app.services.ingestion import (
+    enqueue_ingestion, ingestion_queue, job_summary, JOB_INGEST_URL, JOB_INGEST_DOCUMENT, JOB_REFRESH_URL
+)
 from backend.app.utils.supabase_client import supabase
+from backend.app.services.answer_cache import invalidate_user_answers
+from backend.app.services.vector_store import invalidate_knowledge_base_vectors
+from backend.app.services.entitlements import load_entitlements, invalidate_entitlements
+from backend.app.services.document_extractor import save_upload, UploadTooLarge
+from backend.app.utils.config import INGEST_UPLOAD_DIR, MAX_UPLOAD_SIZE_MB
 from .auth import get_current_active_user
+from pathlib import Path
+import os
 import uuid
 import logging
 import traceback
@@ -30,41 +35,22 @@ async def add_knowledge_base(
     
     # Check user's plan limits before adding knowledge base
     try:
-        # Get user's subscription and plan details
-        client_result = supabase.table("saas_client_profiles")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .execute()
+        # Profile, subscription, plan and knowledge base counts in one query (uncached: this guards a write)
+        entitlements = load_entitlements(user_id)
         
-        if not client_result.data:
+        if not entitlements["client_id"]:
             raise HTTPException(status_code=403, detail="No client profile found")
         
-        client_id = client_result.data[0]["id"]
-        
-        # Get active subscription with plan details
-        sub_result = supabase.table("saas_subscriptions")\
-            .select("*, saas_plans(max_sites, max_documents, can_upload_docs)")\
-            .eq("client_id", client_id)\
-            .eq("status", "active")\
-            .execute()
-        
-        if not sub_result.data:
+        if not entitlements["subscription"]:
             raise HTTPException(status_code=403, detail="No active subscription found")
         
-        plan_info = sub_result.data[0].get("saas_plans", {})
+        plan_info = entitlements["subscription"].get("saas_plans") or {}
         max_sites = plan_info.get("max_sites", 1)
         max_documents = plan_info.get("max_documents", 0)
         can_upload_docs = plan_info.get("can_upload_docs", False)
         
-        # Count existing knowledge bases by type
-        existing_kbs = supabase.table("saas_knowledge_base")\
-            .select("type")\
-            .eq("user_id", user_id)\
-            .eq("status", "active")\
-            .execute()
-        
-        url_count = sum(1 for kb in existing_kbs.data if kb["type"] == "url")
-        doc_count = sum(1 for kb in existing_kbs.data if kb["type"] == "document")
+        url_count = entitlements["active_url_count"]
+        doc_count = entitlements["active_document_count"]
         
         # Check limits based on type
         if type == "url":
@@ -91,6 +77,31 @@ async def add_knowledge_base(
         logger.error(f"Error checking plan limits: {str(e)}")
         # Continue without limit check if there's an error
     
+    # Validate the request before creating anything
+    if type == "url":
+        if not source_url:
+            raise HTTPException(status_code=400, detail="source_url is required for type 'url'")
+    elif type == "document":
+        if not file:
+            raise HTTPException(status_code=400, detail="File is required for type 'document'")
+    else:
+        logger.error("Invalid type, must be 'url' or 'document'")
+        raise HTTPException(status_code=400, detail="Invalid type, must be 'url' or 'document'")
+    
+    file_path = None
+    if type == "document":
+        # Stream the upload to disk, where it stays until a worker has extracted it
+        os.makedirs(INGEST_UPLOAD_DIR, exist_ok=True)
+        file_path = os.path.join(INGEST_UPLOAD_DIR, f"{knowledge_base_id}{Path(file.filename).suffix.lower()}")
+        try:
+            size = await save_upload(file, file_path)
+            logger.info(f"Saved upload {file.filename} ({size} bytes)")
+        except UploadTooLarge:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is too large. The maximum upload size is {MAX_UPLOAD_SIZE_MB:g} MB."
+            )
+    
     # Store knowledge base info in DB FIRST (with pending status)
     try:
         logger.info(f"Creating knowledge base record - Name: {name}, Type: {type}, URL: {source_url}")
@@ -105,88 +116,80 @@ async def add_knowledge_base(
         }
         result = supabase.table("saas_knowledge_base").insert(kb_data).execute()
         logger.info(f"Knowledge base record created with ID: {knowledge_base_id}")
+        invalidate_entitlements(user_id)
     except Exception as e:
         logger.error(f"DB Insertion error: {str(e)}")
         logger.error(traceback.format_exc())
+        if file_path and os.path.exists(file_path):
+            os.unlink(file_path)
         raise HTTPException(status_code=500, detail="Failed to create knowledge base record")
     
-    # Now process the content
+    # Hand the scraping/extraction and indexing off to the ingestion workers
     try:
-        
         if type == "url":
-            if not source_url:
-                raise HTTPException(status_code=400, detail="source_url is required for type 'url'")
-            
-            # Scrape website content
-            logger.info("Scraping website content...")
-            try:
-                # text_content = await scrape_website_text(source_url)
-                text_content = await asyncio.to_thread(scrape_website_text_sync, source_url)
-                logger.debug(f"Scraped content: {text_content[:100] if text_content else 'None'}...")
-            except Exception as scrape_error:
-                logger.error(f"Error during scraping: {str(scrape_error)}")
-                logger.error(traceback.format_exc())
-                raise HTTPException(status_code=500, detail=f"Scraping error: {str(scrape_error)}")
-                
-            if not text_content:
-                logger.error("Failed to scrape website content")
-                raise HTTPException(status_code=400, detail="Failed to scrape website content")
-            
-            # Index scraped content
-            logger.info("Indexing website content...")
-            try:
-                index_result = index_website_content(user_id, source_url, text_content, knowledge_base_id)
-                if not index_result:
-                    logger.error("Failed to index website content")
-                    raise HTTPException(status_code=500, detail="Failed to index website content")
-            except Exception as index_error:
-                logger.error(f"Error during indexing: {str(index_error)}")
-                logger.error(traceback.format_exc())
-                raise HTTPException(status_code=500, detail=f"Indexing error: {str(index_error)}")
-
-        elif type == "document":
-            if not file:
-                raise HTTPException(status_code=400, detail="File is required for type 'document'")
-            
-            # Process uploaded file
-            logger.info("Processing uploaded file...")
-            file_content = await file.read()
-            document_name = file.filename
-            text_content = await process_uploaded_file(file_content, document_name)
-            logger.debug(f"Extracted content: {text_content[:100]}...")
-            if not text_content:
-                logger.error("Failed to extract document content")
-                raise HTTPException(status_code=400, detail="Failed to extract document content")
-            
-            # Index document content
-            logger.info("Indexing document content...")
-            if not index_document_content(user_id, document_name, text_content, knowledge_base_id):
-                logger.error("Failed to index document content")
-                raise HTTPException(status_code=500, detail="Failed to index document content")
-
+            enqueue_ingestion(JOB_INGEST_URL, knowledge_base_id, user_id, {"source_url": source_url})
         else:
-            logger.error("Invalid type, must be 'url' or 'document'")
-            raise HTTPException(status_code=400, detail="Invalid type, must be 'url' or 'document'")
-            
-        # If we reach here, indexing was successful, update status to active
-        logger.info("Updating knowledge base status to active")
-        supabase.table("saas_knowledge_base").update({"status": "active"}).eq("id", knowledge_base_id).execute()
-        
-    except HTTPException:
-        # If there was an error, update status to failed
-        logger.error("Processing failed, updating status to failed")
-        supabase.table("saas_knowledge_base").update({"status": "failed"}).eq("id", knowledge_base_id).execute()
-        raise
+            enqueue_ingestion(JOB_INGEST_DOCUMENT, knowledge_base_id, user_id, {
+                "file_path": file_path,
+                "document_name": file.filename
+            })
     except Exception as ex:
-        # If there was an error, update status to failed
         logger.error(f"Unexpected error: {str(ex)}")
         logger.error(traceback.format_exc())
+        if file_path and os.path.exists(file_path):
+            os.unlink(file_path)
         supabase.table("saas_knowledge_base").update({"status": "failed"}).eq("id", knowledge_base_id).execute()
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(ex)}")
 
-    logger.info("Knowledge base added successfully")
+    logger.info("Knowledge base queued for processing")
     return result.data[0]
 
+@router.get("/status/{kb_id}")
+async def get_knowledge_base_status(kb_id: str, current_user: dict = Depends(get_current_active_user)):
+    """
+    Report the processing status of a knowledge base and the progress of its latest ingestion job
+    """
+    kb_result = supabase.table("saas_knowledge_base")\
+        .select("id, status")\
+        .eq("id", kb_id)\
+        .eq("user_id", current_user["id"])\
+        .execute()
+    
+    if not kb_result.data:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    
+    return {
+        "id": kb_id,
+        "status": kb_result.data[0]["status"],
+        "job": job_summary(ingestion_queue.latest_for_knowledge_base(kb_id))
+    }
+
+@router.post("/refresh/{kb_id}")
+async def refresh_knowledge_base(kb_id: str, current_user: dict = Depends(get_current_active_user)):
+    """
+    Queue a re-crawl of a URL knowledge base that re-indexes only the pages that changed
+    """
+    kb_result = supabase.table("saas_knowledge_base")\
+        .select("id, type, source_url, status")\
+        .eq("id", kb_id)\
+        .eq("user_id", current_user["id"])\
+        .execute()
+    
+    if not kb_result.data:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    
+    kb = kb_result.data[0]
+    if kb["type"] != "url" or not kb.get("source_url"):
+        raise HTTPException(status_code=400, detail="Only URL knowledge bases can be refreshed")
+    
+    logger.info(f"Queueing refresh of knowledge base {kb_id} from {kb['source_url']}")
+    job = enqueue_ingestion(JOB_REFRESH_URL, kb_id, current_user["id"], {"source_url": kb["source_url"]},
+                            exclusive=True)
+    if job is None:
+        raise HTTPException(status_code=409, detail="This knowledge base is already being processed")
+    
+    return {"message": "Knowledge base refresh queued", "job": job_summary(job)}
+
 @router.delete("/delete/{kb_id}")
 async def delete_knowledge_base(kb_id: str, current_user: dict = Depends(get_current_active_user)):
     # Check if KB belongs to user
@@ -207,5 +210,8 @@ async def delete_knowledge_base(kb_id: str, current_user: dict = Depends(get_cur
     
     # Delete knowledge base record
     supabase.table("saas_knowledge_base").delete().eq("id", kb_id).execute()
+    invalidate_user_answers(current_user["id"])
+    invalidate_entitlements(current_user["id"])
+    invalidate_knowledge_base_vectors(kb_id)
     
     return {"message": "Knowledge base deleted successfully"}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Header
 from typing import Optional, Dict, Any
 from backend.app.services.stripe_service import StripeService
+from backend.app.services.entitlements import load_entitlements, get_entitlements, invalidate_entitlements
 from backend.app.utils.supabase_client import supabase
 from .auth import get_current_active_user
 import stripe
@@ -26,19 +27,15 @@ async def create_checkout_session(
         user_email = current_user["email"]
         
         # Get client profile
-        client_result = supabase.table("saas_client_profiles")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .execute()
+        client_id = load_entitlements(user_id)["client_id"]
         
-        if not client_result.data:
+        if not client_id:
             raise HTTPException(status_code=404, detail="Client profile not found")
         
-        client_id = client_result.data[0]["id"]
-        
         # Handle Freemium plan separately
         if request.plan_name == "Freemium":
             subscription_id = await stripe_service.create_freemium_subscription(user_id, client_id)
+            invalidate_entitlements(user_id)
             return {
                 "success": True,
                 "subscription_id": subscription_id,
@@ -85,6 +82,7 @@ async def cancel_subscription(
         raise HTTPException(status_code=403, detail="Not authorized to cancel this subscription")
     
     success = await stripe_service.cancel_subscription(subscription_id)
+    invalidate_entitlements(current_user["id"])
     
     if success:
         return {"message": "Subscription cancelled successfully"}
@@ -94,28 +92,12 @@ async def cancel_subscription(
 @router.get("/subscription-status")
 async def get_subscription_status(current_user: dict = Depends(get_current_active_user)):
     """Get current subscription status"""
-    # Get client profile
-    client_result = supabase.table("saas_client_profiles")\
-        .select("id")\
-        .eq("user_id", current_user["id"])\
-        .execute()
+    # Profile, active subscription and plan in one query
+    subscription = get_entitlements(current_user["id"])["subscription"]
     
-    if not client_result.data:
+    if not subscription:
         return {"has_subscription": False}
     
-    client_id = client_result.data[0]["id"]
-    
-    # Get active subscription
-    sub_result = supabase.table("saas_subscriptions")\
-        .select("*, saas_plans(name, max_messages, max_sites, max_documents)")\
-        .eq("client_id", client_id)\
-        .eq("status", "active")\
-        .execute()
-    
-    if not sub_result.data:
-        return {"has_subscription": False}
-    
-    subscription = sub_result.data[0]
     plan = subscription["saas_plans"]
     
     return {
@@ -232,6 +214,12 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
                         .insert(payment_data)\
                         .execute()
         
+        # Subscription state may have changed; only checkout sessions carry the user id
+        if event["type"] == "checkout.session.completed":
+            invalidate_entitlements(event["data"]["object"].get("metadata", {}).get("user_id"))
+        elif event["type"] in ("customer.subscription.updated", "customer.subscription.deleted"):
+            invalidate_entitlements()
+        
         # Mark webhook as processed
         supabase.table("saas_stripe_webhooks")\
             .update({"processed": True})\
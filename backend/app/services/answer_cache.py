@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+import logging
+import threading
+import time
+
+import numpy as np
+
+from backend.app.utils.config import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_MAX_SCOPES
+)
+
+logger = logging.getLogger(__name__)
+
+
+def cache_scope(user_id: str, knowledge_base_ids: Optional[Sequence[str]] = None) -> tuple:
+    """Answers are only reused within the same user and set of knowledge bases"""
+    return user_id, tuple(sorted(knowledge_base_ids)) if knowledge_base_ids else ()
+
+
+class _ScopeEntries:
+    """Cached answers of one scope, with their question embeddings as a matrix"""
+
+    def __init__(self):
+        self.entries = OrderedDict()  # question -> entry dict, least recently used first
+        self._matrix = None
+        self._questions: List[str] = []
+
+    def matrix(self):
+        if self._matrix is None and self.entries:
+            self._questions = list(self.entries)
+            self._matrix = np.stack([self.entries[q]["embedding"] for q in self._questions])
+        return self._matrix, self._questions
+
+    def changed(self):
+        self._matrix = None
+
+
+class AnswerCache:
+    """
+    In-process semantic cache of chat answers. Invalidation only reaches this
+    process; with several workers, keep the TTL short.
+    A new question hits when its embedding's cosine similarity to a previously
+    answered question in the same scope reaches `similarity`. Entries expire
+    after `ttl` seconds; each scope keeps at most `max_entries` answers and at
+    most `max_scopes` scopes are kept, both evicted least-recently-used.
+    Each user has a generation, bumped by invalidate_user(); an answer is only
+    stored if the user's generation has not changed since it was looked up,
+    so a reply built from content retrieved before an invalidation is dropped.
+    """
+
+    def __init__(self, similarity: float = 0.95, ttl: int = 300, max_entries: int = 200, max_scopes: int = 1000):
+        self.similarity = similarity
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self.hits = 0
+        self.misses = 0
+        self._scopes = OrderedDict()
+        self._generations = {}  # user_id -> number of invalidations
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, scope: tuple, query_embedding) -> Optional[dict]:
+        """Return the cached entry for the most similar previous question, if similar enough"""
+        query = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is None or not bucket.entries:
+                self.misses += 1
+                return None
+
+            # Drop expired answers before matching
+            expired = [q for q, entry in bucket.entries.items() if now - entry["created_at"] > self.ttl]
+            for question in expired:
+                del bucket.entries[question]
+            if expired:
+                bucket.changed()
+            if not bucket.entries:
+                self.misses += 1
+                return None
+
+            matrix, questions = bucket.matrix()
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                self.misses += 1
+                return None
+
+            question = questions[best]
+            bucket.entries.move_to_end(question)
+            self._scopes.move_to_end(scope)
+            self.hits += 1
+            entry = bucket.entries[question]
+            logger.debug(f"Answer cache hit (similarity {scores[best]:.3f}) for question: {question[:80]}")
+            return {"question": question, "answer": entry["answer"], "sources": entry["sources"],
+                    "similarity": float(scores[best])}
+
+    def generation(self, user_id: str) -> int:
+        """Pass to store() with an answer computed after this call"""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def store(self, scope: tuple, question: str, query_embedding, answer: str, sources: list = None,
+              generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self._generations.get(scope[0], 0):
+                logger.debug(f"Not caching answer computed before an invalidation: {question[:80]}")
+                return
+            bucket = self._scopes.get(scope)
+            if bucket is None:
+                bucket = self._scopes[scope] = _ScopeEntries()
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope)
+
+            bucket.entries[question] = {
+                "embedding": self._normalize(query_embedding),
+                "answer": answer,
+                "sources": sources or [],
+                "created_at": time.time()
+            }
+            bucket.entries.move_to_end(question)
+            while len(bucket.entries) > self.max_entries:
+                bucket.entries.popitem(last=False)
+            bucket.changed()
+
+    def invalidate_user(self, user_id: str):
+        """Forget every cached answer of a user, e.g. after their knowledge bases changed"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for scope in [scope for scope in self._scopes if scope[0] == user_id]:
+                del self._scopes[scope]
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "scopes": len(self._scopes),
+                "entries": sum(len(bucket.entries) for bucket in self._scopes.values())
+            }
+
+
+answer_cache: Optional[AnswerCache] = AnswerCache(
+    similarity=ANSWER_CACHE_SIMILARITY,
+    ttl=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    max_scopes=ANSWER_CACHE_MAX_SCOPES
+) if ANSWER_CACHE_ENABLED else None
+
+
+def invalidate_user_answers(user_id: str):
+    """
+    Hook for knowledge base changes: cached answers may no longer match the content.
+    Only this process's cache is cleared; other workers expire theirs after the TTL.
+    """
+    if answer_cache is not None:
+        answer_cache.invalidate_user(user_id)
@@ -1,13 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from backend.app.utils.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.app.utils.config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES, TOKEN_USER_CLAIMS,
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+)
 from backend.app.utils.supabase_client import supabase
+from backend.app.utils.cache import TTLCache
+import asyncio
 import uuid
 import re
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt is deliberately CPU-heavy. It runs on a small dedicated pool so login
+# bursts neither block the event loop nor take every core from chat traffic.
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+# Columns of saas_users exposed as the authenticated user (never the password hash)
+USER_COLUMNS = "id, email, full_name, created_at, updated_at"
+
+# token subject (email) -> user record
+_user_cache = TTLCache(ttl=USER_CACHE_TTL_SECONDS, max_entries=USER_CACHE_MAX_ENTRIES)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -15,6 +32,19 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def _run_password_task(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_password_executor, func, *args)
+
+async def aget_password_hash(password: str) -> str:
+    return await _run_password_task(pwd_context.hash, password)
+
+async def averify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify off the event loop. Also returns a replacement hash when the stored
+    one uses a different work factor than BCRYPT_ROUNDS (None otherwise)
+    """
+    return await _run_password_task(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -25,16 +55,42 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
+def token_claims_for_user(user: dict) -> dict:
+    """JWT claims for a user; stable profile fields are embedded when TOKEN_USER_CLAIMS is on"""
+    claims = {"sub": user["email"]}
+    if TOKEN_USER_CLAIMS:
+        created_at = user.get("created_at")
+        claims.update({
+            "uid": user["id"],
+            "name": user["full_name"],
+            "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at
+        })
+    return claims
+
+def decode_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        if payload.get("sub") is None:
             return None
-        return email
+        return payload
     except JWTError:
         return None
 
+def verify_token(token: str) -> Optional[str]:
+    payload = decode_token(token)
+    return payload["sub"] if payload else None
+
+def user_from_claims(payload: dict) -> Optional[dict]:
+    """Build the user from embedded token claims, or None if the token does not carry them"""
+    if not TOKEN_USER_CLAIMS or not all(payload.get(claim) for claim in ("uid", "name", "created_at")):
+        return None
+    return {
+        "id": payload["uid"],
+        "email": payload["sub"],
+        "full_name": payload["name"],
+        "created_at": payload["created_at"]
+    }
+
 async def register_user(email: str, password: str, full_name: str, plan_id: str = None) -> dict:
     try:
         # Check if user exists
@@ -44,7 +100,7 @@ async def register_user(email: str, password: str, full_name: str, plan_id: str
         
         # Create user
         user_id = str(uuid.uuid4())
-        hashed_password = get_password_hash(password)
+        hashed_password = await aget_password_hash(password)
         
         user_data = {
             "id": user_id,
@@ -54,6 +110,7 @@ async def register_user(email: str, password: str, full_name: str, plan_id: str
         }
         
         result = supabase.table("saas_users").insert(user_data).execute()
+        invalidate_cached_user(email)
         
         # Also create client profile
         client_data = {
@@ -139,13 +196,31 @@ async def authenticate_user(email: str, password: str):
         return None
     
     user = result.data[0]
-    if not verify_password(password, user["password_hash"]):
+    valid, new_hash = await averify_password(password, user["password_hash"])
+    if not valid:
         return None
     
+    if new_hash:
+        # Work factor changed since this password was stored: upgrade the hash
+        try:
+            supabase.table("saas_users").update({"password_hash": new_hash}).eq("id", user["id"]).execute()
+        except Exception as e:
+            print(f"Could not rehash password for {email}: {str(e)}")
+    
     return user
 
 async def get_current_user(email: str):
-    result = supabase.table("saas_users").select("*").eq("email", email).execute()
+    user = _user_cache.get(email)
+    if user is not None:
+        return user
+
+    result = supabase.table("saas_users").select(USER_COLUMNS).eq("email", email).execute()
     if result.data:
+        # Unknown users are not cached, so a new registration is seen immediately
+        _user_cache.set(email, result.data[0])
         return result.data[0]
     return None
+
+def invalidate_cached_user(email: Optional[str] = None):
+    """Call after a user's profile changes; with no email the whole cache is dropped"""
+    _user_cache.invalidate(email)
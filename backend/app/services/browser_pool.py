@@ -0,0 +1,125 @@
+from backend.app.utils.config import BROWSER_POOL_SIZE, BROWSER_PAGES_PER_BROWSER, CRAWL_PAGE_TIMEOUT_SECONDS
+from typing import List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledBrowser:
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.active = 0  # pages being rendered
+        self.retired = False
+
+
+class BrowserPool:
+    """
+    Long-lived crawl4ai browsers shared by every crawl in the process.
+    Up to `size` browsers are started on first use and kept open, each
+    rendering at most `pages_per_browser` pages at a time; callers wait for a
+    free slot. A browser that raises is retired and replaced on demand.
+    start() / close() are called from the app lifespan.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, pages_per_browser: int = BROWSER_PAGES_PER_BROWSER,
+                 page_timeout: float = CRAWL_PAGE_TIMEOUT_SECONDS):
+        self.size = max(1, size)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.page_timeout = page_timeout
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._browsers: List[_PooledBrowser] = []
+        self._starting = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def start(self):
+        """Bind the pool to the running event loop; browsers start lazily"""
+        self.loop = asyncio.get_running_loop()
+        self._condition = asyncio.Condition()
+
+    async def close(self):
+        browsers, self._browsers = self._browsers, []
+        for browser in browsers:
+            await self._close_browser(browser)
+        self.loop = None
+        self._condition = None
+
+    @staticmethod
+    async def _close_browser(browser: _PooledBrowser):
+        try:
+            await browser.crawler.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser: {e}")
+
+    async def _checkout(self) -> _PooledBrowser:
+        if self._condition is None:
+            self.start()  # used outside the app, e.g. from a script
+        async with self._condition:
+            while True:
+                free = [b for b in self._browsers if b.active < self.pages_per_browser]
+                if free:
+                    browser = min(free, key=lambda b: b.active)
+                    browser.active += 1
+                    return browser
+                if len(self._browsers) + self._starting < self.size:
+                    self._starting += 1
+                    break
+                await self._condition.wait()
+
+        # Start a browser outside the lock so pages keep flowing to the running ones
+        browser = None
+        try:
+            from crawl4ai import AsyncWebCrawler
+            crawler = AsyncWebCrawler()
+            try:
+                await crawler.start()
+            except BaseException:
+                # A half-started crawler may already have launched its browser process
+                await self._close_browser(_PooledBrowser(crawler))
+                raise
+            browser = _PooledBrowser(crawler)
+            browser.active = 1
+        finally:
+            async with self._condition:
+                self._starting -= 1
+                if browser is not None:
+                    self._browsers.append(browser)
+                self._condition.notify_all()
+        logger.info(f"Started pooled browser ({len(self._browsers)}/{self.size})")
+        return browser
+
+    async def _checkin(self, browser: _PooledBrowser, failed: bool):
+        async with self._condition:
+            browser.active -= 1
+            if failed and not browser.retired:
+                browser.retired = True
+                if browser in self._browsers:
+                    self._browsers.remove(browser)
+            self._condition.notify_all()
+        if browser.retired and browser.active == 0:
+            await self._close_browser(browser)
+
+    async def render(self, url: str):
+        """crawl4ai CrawlResult of one page, rendered on a pooled browser"""
+        from crawl4ai import CrawlerRunConfig
+        browser = await self._checkout()
+        failed = False
+        try:
+            return await browser.crawler.arun(
+                url=url, config=CrawlerRunConfig(page_timeout=int(self.page_timeout * 1000))
+            )
+        except Exception:
+            failed = True
+            raise
+        finally:
+            await self._checkin(browser, failed)
+
+    def stats(self) -> dict:
+        return {
+            "browsers": len(self._browsers),
+            "active_pages": sum(b.active for b in self._browsers),
+            "capacity": self.size * self.pages_per_browser
+        }
+
+
+browser_pool = BrowserPool()
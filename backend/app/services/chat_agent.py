@@ -1,78 +1,323 @@
-from langchain.chains.retrieval_qa.base import RetrievalQA
-from langchain_community.vectorstores import SupabaseVectorStore
+from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_community.callbacks.manager import get_openai_callback
-from backend.app.utils.config import SUPABASE_VECTOR_TABLE, SUPABASE_MATCH_FUNC
-from backend.app.utils.supabase_client import supabase
-from backend.app.services.chat_history import save_chat_history
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+from backend.app.utils.config import (
+    CHAT_MODEL, CHAT_TEMPERATURE, CHAT_RETRIEVAL_K, CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_SIMILARITY
+)
+from backend.app.services.vector_store import ChunkStore, get_chunk_store
+from backend.app.services.embedding_cache import create_embeddings, embedding_model_name
+from backend.app.services.context_builder import build_context, count_tokens
+from backend.app.services.conversation import ConversationMemory
+from backend.app.services.chat_history import save_chat_history, asave_chat_history
+from backend.app.services.answer_cache import AnswerCache, answer_cache as shared_answer_cache, cache_scope
+from backend.app.services.query_embedding_cache import QueryEmbeddingCache, query_embedding_cache as shared_query_cache
+from typing import Optional, Sequence
 import os
+import threading
 
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-def get_chat_response(user_id: str, message: str, chat_history: list) -> str:
-    try:
-        embedding = OpenAIEmbeddings()
-        vectordb = SupabaseVectorStore(
-            client=supabase,
-            embedding=embedding,
-            table_name=SUPABASE_VECTOR_TABLE,
-            query_name=SUPABASE_MATCH_FUNC
-        )
-        
-        retriever = vectordb.as_retriever(
-            search_kwargs={"filter": {"user_id": user_id}, "k": 10}
-        )
-        
-        # Define prompt (only accepts `question`)
-        custom_prompt = PromptTemplate(
-            input_variables=["question", "context"],
-            template="""
-            You are an intelligent assistant trained to answer questions based ONLY on the given context.
-            Answer using **Markdown** formatting when possible.
-
-            - Think carefully about synonyms or indirect mentions.
-            - If the context includes the answer in any form, extract and summarize it.
-            - ONLY if it's truly unrelated, politely inform the user that the information is not available and provide the contact details 
-            (email, phone number(s), or contact page URL) from the content, so the user can reach out directly.
-
-            Context:
-            {context}
-
-            Question: {question}
-            Answer:
-            """
-        )
+# Answer prompt: retrieved context, the bounded conversation so far and the question
+CHAT_PROMPT = PromptTemplate(
+    input_variables=["question", "context", "history"],
+    template="""
+    You are an intelligent assistant trained to answer questions based ONLY on the given context.
+    Answer using **Markdown** formatting when possible.
+
+    - Think carefully about synonyms or indirect mentions.
+    - If the context includes the answer in any form, extract and summarize it.
+    - ONLY if it's truly unrelated, politely inform the user that the information is not available and provide the contact details
+    (email, phone number(s), or contact page URL) from the content, so the user can reach out directly.
+
+    Context:
+    {context}
+
+    Conversation so far (may be empty):
+    {history}
+
+    Question: {question}
+    Answer:
+    """
+)
 
-        # Build the chain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=ChatOpenAI(model="gpt-4o", temperature=0),
-            retriever=retriever,
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": custom_prompt},
-            input_key="question",
-            output_key="answer"
+
+class ChatEngine:
+    """
+    Long-lived retrieval QA pipeline.
+    The embeddings client, chunk store, LLM and document chain are built once
+    and shared across requests (their HTTP clients keep pooled connections);
+    only the user / knowledge base scope of retrieval is bound on each call.
+    Retrieved chunks are packed into at most `context_tokens` prompt tokens;
+    conversation history goes through a bounded, summarising memory.
+    """
+
+    def __init__(self, model: str = CHAT_MODEL, temperature: float = CHAT_TEMPERATURE,
+                 embedding=None, llm=None, store: Optional[ChunkStore] = None, k: int = CHAT_RETRIEVAL_K,
+                 answer_cache: Optional[AnswerCache] = shared_answer_cache,
+                 query_cache: Optional[QueryEmbeddingCache] = shared_query_cache,
+                 context_tokens: int = CONTEXT_TOKEN_BUDGET, min_similarity: float = CONTEXT_MIN_SIMILARITY,
+                 memory: Optional[ConversationMemory] = None):
+        self.k = k
+        self.model = model
+        self.context_tokens = context_tokens
+        self.min_similarity = min_similarity
+        self.answer_cache = answer_cache
+        self.query_cache = query_cache
+        self.embedding = embedding or create_embeddings()
+        # stream_usage makes streamed completions report token usage for billing
+        self.llm = llm or ChatOpenAI(model=model, temperature=temperature, stream_usage=True)
+        self.store = store or get_chunk_store()
+        self.memory = memory or ConversationMemory()
+        # "stuff" chain: all retrieved chunks are placed into the prompt's {context}
+        self.qa_chain = create_stuff_documents_chain(self.llm, CHAT_PROMPT)
+        # Load the tokenizer now rather than inside the first request
+        count_tokens("", model)
+
+    @staticmethod
+    def _stuff_prompt(docs: list, message: str, history: str = "") -> str:
+        return CHAT_PROMPT.format(
+            context="\n\n".join(doc.page_content for doc in docs),
+            question=message,
+            history=history
         )
 
+    @property
+    def embedding_model(self) -> str:
+        return embedding_model_name(self.embedding)
+
+    def embed_query(self, message: str) -> list:
+        if self.query_cache is None:
+            return self.embedding.embed_query(message)
+        return self.query_cache.embed_query(self.embedding, self.embedding_model, message)
+
+    async def aembed_query(self, message: str) -> list:
+        if self.query_cache is None:
+            return await self.embedding.aembed_query(message)
+        return await self.query_cache.aembed_query(self.embedding, self.embedding_model, message)
+
+    def retrieve(self, user_id: str, query_embedding: list, knowledge_base_ids: Optional[Sequence[str]] = None,
+                 query_text: Optional[str] = None) -> list:
+        """Context documents for a question; with its text, full-text matches are fused in (hybrid search)"""
+        docs = self.store.search(query_embedding, user_id, knowledge_base_ids, k=self.k, query_text=query_text)
+        return build_context(docs, self.context_tokens, self.min_similarity, self.model)
+
+    async def aretrieve(self, user_id: str, query_embedding: list,
+                        knowledge_base_ids: Optional[Sequence[str]] = None, query_text: Optional[str] = None) -> list:
+        docs = await self.store.asearch(query_embedding, user_id, knowledge_base_ids, k=self.k,
+                                        query_text=query_text)
+        return build_context(docs, self.context_tokens, self.min_similarity, self.model)
+
+    def _cached_answer(self, user_id: str, query_embedding: list,
+                       knowledge_base_ids: Optional[Sequence[str]] = None, history: str = "") -> Optional[dict]:
+        # Answers shaped by a conversation are neither served from nor written to the
+        # cache: it is keyed on the question only and shared by every visitor of the KB
+        if self.answer_cache is None or history:
+            return None
+        cached = self.answer_cache.lookup(cache_scope(user_id, knowledge_base_ids), query_embedding)
+        if cached is None:
+            return None
+        # A cache hit costs no completion tokens (only a follow-up's condensation, if any)
+        return {
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "cached": True
+        }
+
+    def _cache_generation(self, user_id: str) -> Optional[int]:
+        return self.answer_cache.generation(user_id) if self.answer_cache is not None else None
+
+    def _remember_answer(self, user_id: str, knowledge_base_ids: Optional[Sequence[str]], question: str,
+                         query_embedding: list, answer: str, sources: list, generation: Optional[int] = None,
+                         history: str = ""):
+        if self.answer_cache is not None and answer and not history:
+            self.answer_cache.store(cache_scope(user_id, knowledge_base_ids), question, query_embedding, answer,
+                                    sources, generation)
+
+    @staticmethod
+    def _with_usage(result: dict, cb) -> dict:
+        return {
+            **result,
+            "input_tokens": cb.prompt_tokens,
+            "output_tokens": cb.completion_tokens,
+            "total_cost_usd": cb.total_cost
+        }
+
+    def respond(self, user_id: str, message: str, knowledge_base_ids: Optional[Sequence[str]] = None,
+                chat_history: Optional[list] = None, session_id: Optional[str] = None) -> dict:
+        """Answer a message and report token usage for this call"""
+        with get_openai_callback() as cb:
+            # Follow-ups are retrieved by their standalone form
+            conversation = self.memory.prepare(user_id, session_id, chat_history, message)
+            query_embedding = self.embed_query(conversation.query)
+            cached = self._cached_answer(user_id, query_embedding, knowledge_base_ids, conversation.history)
+            if cached:
+                return self._with_usage(cached, cb)
+
+            generation = self._cache_generation(user_id)
+            docs = self.retrieve(user_id, query_embedding, knowledge_base_ids, conversation.query)
+            answer = self.qa_chain.invoke({"context": docs, "question": message, "history": conversation.history})
+
+        sources = summarize_sources(docs)
+        self._remember_answer(user_id, knowledge_base_ids, conversation.query, query_embedding, answer, sources,
+                              generation, conversation.history)
+        return self._with_usage({"answer": answer, "sources": sources, "cached": False}, cb)
+
+    async def arespond(self, user_id: str, message: str, knowledge_base_ids: Optional[Sequence[str]] = None,
+                       chat_history: Optional[list] = None, session_id: Optional[str] = None) -> dict:
+        """Async variant of respond - never blocks the event loop"""
         with get_openai_callback() as cb:
-            result = qa_chain.invoke({"question": message})
+            conversation = await self.memory.aprepare(user_id, session_id, chat_history, message)
+            query_embedding = await self.aembed_query(conversation.query)
+            cached = self._cached_answer(user_id, query_embedding, knowledge_base_ids, conversation.history)
+            if cached:
+                return self._with_usage(cached, cb)
+
+            generation = self._cache_generation(user_id)
+            docs = await self.aretrieve(user_id, query_embedding, knowledge_base_ids, conversation.query)
+            answer = await self.qa_chain.ainvoke({"context": docs, "question": message,
+                                                  "history": conversation.history})
+
+        sources = summarize_sources(docs)
+        self._remember_answer(user_id, knowledge_base_ids, conversation.query, query_embedding, answer, sources,
+                              generation, conversation.history)
+        return self._with_usage({"answer": answer, "sources": sources, "cached": False}, cb)
+
+    async def astream(self, user_id: str, message: str, knowledge_base_ids: Optional[Sequence[str]] = None,
+                      chat_history: Optional[list] = None, session_id: Optional[str] = None):
+        """
+        Stream an answer as ("token", text) events, followed by one
+        ("done", result) event carrying sources and token usage
+        """
+        # The usage callback is passed explicitly: the generator is resumed across
+        # separate steps, so get_openai_callback's context would not follow it
+        cb = OpenAICallbackHandler()
+        conversation = await self.memory.aprepare(user_id, session_id, chat_history, message, callbacks=[cb])
+        query_embedding = await self.aembed_query(conversation.query)
+        cached = self._cached_answer(user_id, query_embedding, knowledge_base_ids, conversation.history)
+        if cached:
+            yield "token", cached["answer"]
+            yield "done", self._with_usage(cached, cb)
+            return
+
+        generation = self._cache_generation(user_id)
+        docs = await self.aretrieve(user_id, query_embedding, knowledge_base_ids, conversation.query)
+        prompt = self._stuff_prompt(docs, message, conversation.history)
+        parts = []
+        async for chunk in self.llm.astream(prompt, config={"callbacks": [cb]}):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield "token", chunk.content
+
+        answer = "".join(parts)
+        sources = summarize_sources(docs)
+        self._remember_answer(user_id, knowledge_base_ids, conversation.query, query_embedding, answer, sources,
+                              generation, conversation.history)
+        yield "done", self._with_usage({"answer": answer, "sources": sources, "cached": False}, cb)
+
+def summarize_sources(docs: list) -> list:
+    """Distinct sources (page URL or document name) of the retrieved chunks"""
+    sources = []
+    seen = set()
+    for doc in docs:
+        metadata = doc.metadata or {}
+        key = (metadata.get("source_url"), metadata.get("document_name"))
+        if key in seen or key == (None, None):
+            continue
+        seen.add(key)
+        sources.append({
+            "source_url": metadata.get("source_url"),
+            "document_name": metadata.get("document_name"),
+            "knowledge_base_id": metadata.get("knowledge_base_id")
+        })
+    return sources
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_chat_engine(model: str = CHAT_MODEL, temperature: float = CHAT_TEMPERATURE) -> ChatEngine:
+    """Return the shared engine for a model configuration, creating it on first use"""
+    key = (model, temperature)
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = ChatEngine(model=model, temperature=temperature)
+                _engines[key] = engine
+    return engine
+
+
+def get_chat_response(user_id: str, message: str, chat_history: list,
+                      knowledge_base_ids: Optional[Sequence[str]] = None, session_id: Optional[str] = None) -> str:
+    try:
+        result = get_chat_engine().respond(user_id, message, knowledge_base_ids, chat_history, session_id)
+        answer = result["answer"]
+
+        # Save chat history with token usage & cost for THIS call
+        save_chat_history(
+            user_id, message, answer,
+            result["input_tokens"], result["output_tokens"], result["total_cost_usd"]
+        )
+
+        return answer
+
+    except Exception as e:
+        print(f"Chat error: {e}")
+        return "I'm sorry, I encountered an error while processing your request. Please try again later."
+
+
+async def aget_chat_response(user_id: str, message: str, chat_history: list,
+                             knowledge_base_ids: Optional[Sequence[str]] = None, session_id: Optional[str] = None) -> str:
+    """Async variant of get_chat_response for use from request handlers"""
+    try:
+        result = await get_chat_engine().arespond(user_id, message, knowledge_base_ids, chat_history, session_id)
         answer = result["answer"]
 
-        # Print token usage & cost for THIS call
-        # print(f"Prompt tokens: {cb.prompt_tokens}")
-        # print(f"Completion tokens: {cb.completion_tokens}")
-        # print(f"Total tokens: {cb.total_tokens}")
-        # print(f"Estimated cost (USD): {cb.total_cost:.6f}")
-
-        # Getting token usage and cost per message
-        input_tokens = cb.prompt_tokens
-        output_tokens = cb.completion_tokens
-        total_cost_usd = cb.total_cost
-        # Save chat history
-        save_chat_history(user_id, message, answer, input_tokens, output_tokens, total_cost_usd)
-        
+        await asave_chat_history(
+            user_id, message, answer,
+            result["input_tokens"], result["output_tokens"], result["total_cost_usd"]
+        )
+
         return answer
 
     except Exception as e:
         print(f"Chat error: {e}")
         return "I'm sorry, I encountered an error while processing your request. Please try again later."
+
+
+async def astream_chat_response(user_id: str, message: str, chat_history: list,
+                               knowledge_base_ids: Optional[Sequence[str]] = None, session_id: Optional[str] = None):
+    """
+    Async generator of (event, data) pairs for a streamed answer:
+    "token" events with text deltas, then "done" with sources and usage (or "error")
+    """
+    try:
+        async for event, data in get_chat_engine().astream(user_id, message, knowledge_base_ids,
+                                                           chat_history, session_id):
+            if event == "token":
+                yield "token", data
+                continue
+
+            await asave_chat_history(
+                user_id, message, data["answer"],
+                data["input_tokens"], data["output_tokens"], data["total_cost_usd"]
+            )
+            yield "done", {
+                "sources": data["sources"],
+                "cached": data["cached"],
+                "usage": {
+                    "input_tokens": data["input_tokens"],
+                    "output_tokens": data["output_tokens"],
+                    "total_cost_usd": data["total_cost_usd"]
+                }
+            }
+
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        yield "error", {
+            "message": "I'm sorry, I encountered an error while processing your request. Please try again later."
+        }
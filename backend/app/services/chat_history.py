@@ -1,5 +1,6 @@
 from backend.app.utils.supabase_client import supabase
 from typing import List
+import asyncio
 import datetime
 
 def save_chat_history(user_id: str, message: str, response: str, input_tokens=0, output_tokens=0, total_cost_usd=0.00):
@@ -18,6 +19,11 @@ def save_chat_history(user_id: str, message: str, response: str, input_tokens=0,
         print(f"Error saving chat history: {e}")
 
 
+async def asave_chat_history(user_id: str, message: str, response: str, input_tokens=0, output_tokens=0, total_cost_usd=0.00):
+    """Write chat history from async code without blocking the event loop"""
+    await asyncio.to_thread(save_chat_history, user_id, message, response, input_tokens, output_tokens, total_cost_usd)
+
+
 def get_chat_history(user_id: str, knowledge_base_id: str) -> List[dict]:
     try:
         result = supabase.table("saas_chat_history")\
@@ -0,0 +1,146 @@
+from langchain_core.documents import Document
+from backend.app.utils.config import CHAT_MODEL, CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_SIMILARITY
+from typing import List, Optional
+import logging
+import threading
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Joins chunks in the prompt's {context}
+CONTEXT_SEPARATOR = "\n\n"
+
+# Longest overlap looked for between chunks without offsets (the splitter overlaps 200 chars)
+_MAX_TEXT_OVERLAP = 300
+_MIN_TEXT_OVERLAP = 20
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: str):
+    """tiktoken encoding of a chat model, or None when it cannot be loaded (e.g. offline)"""
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                logger.warning(f"No tiktoken encoding for {model}, estimating 4 characters per token: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str = CHAT_MODEL) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text: str, tokens: int, model: str = CHAT_MODEL) -> str:
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:tokens * 4]
+    return encoding.decode(encoding.encode(text)[:tokens])
+
+
+def _source_key(doc: Document) -> tuple:
+    metadata = doc.metadata or {}
+    return metadata.get("knowledge_base_id"), metadata.get("source_url"), metadata.get("document_name")
+
+
+def _text_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that starts `second`"""
+    for size in range(min(len(first), len(second), _MAX_TEXT_OVERLAP), _MIN_TEXT_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+class _Span:
+    """A run of merged chunks from one source, ranked by its best member"""
+
+    def __init__(self, doc: Document, rank: int):
+        metadata = doc.metadata or {}
+        self.text = doc.page_content
+        self.start = metadata.get("start_index")
+        self.rank = rank
+        self.metadata = dict(metadata)
+
+    @property
+    def end(self) -> Optional[int]:
+        return self.start + len(self.text) if self.start is not None else None
+
+    def merge(self, other: "_Span") -> bool:
+        """Append `other` if it continues or overlaps this span"""
+        if self.start is not None and other.start is not None:
+            if other.start > self.end or other.start < self.start:
+                return False
+            if other.end > self.end:
+                self.text += other.text[self.end - other.start:]
+        elif other.text not in self.text:
+            overlap = _text_overlap(self.text, other.text)
+            if not overlap:
+                return False
+            self.text += other.text[overlap:]
+        self.rank = min(self.rank, other.rank)
+        for key in ("similarity", "text_rank", "rrf_score"):
+            values = [v for v in (self.metadata.get(key), other.metadata.get(key)) if v is not None]
+            if values:
+                self.metadata[key] = max(values)
+        return True
+
+
+def _merge_spans(docs: List[Document]) -> List[_Span]:
+    """Collapse duplicate, overlapping and adjacent chunks of the same source into spans"""
+    groups = {}
+    for rank, doc in enumerate(docs):
+        groups.setdefault(_source_key(doc), []).append(_Span(doc, rank))
+
+    spans = []
+    for group in groups.values():
+        # Chunks with splitter offsets merge in document order; others in retrieval order
+        group.sort(key=lambda span: (span.start is None, span.start or 0, span.rank))
+        merged = []
+        for span in group:
+            if not any(existing.merge(span) for existing in merged):
+                merged.append(span)
+        spans.extend(merged)
+    spans.sort(key=lambda span: span.rank)
+    return spans
+
+
+def build_context(docs: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  min_similarity: float = CONTEXT_MIN_SIMILARITY, model: str = CHAT_MODEL) -> List[Document]:
+    """
+    Turn retrieved chunks (most relevant first) into the documents stuffed into the prompt:
+    chunks below `min_similarity` are dropped (full-text-only hits have no
+    similarity and are kept), duplicates and the splitter's overlaps are
+    removed, neighbouring chunks of a source are merged, and spans are added in
+    relevance order while they fit in `token_budget` tokens.
+    """
+    if not docs:
+        return []
+
+    relevant = [doc for doc in docs
+                if (doc.metadata or {}).get("similarity") is None or doc.metadata["similarity"] >= min_similarity]
+    if not relevant:
+        # Keep the best chunk so the model can still point to contact details
+        relevant = docs[:1]
+
+    packed = []
+    used = 0
+    separator = count_tokens(CONTEXT_SEPARATOR, model)
+    for span in _merge_spans(relevant):
+        tokens = count_tokens(span.text, model) + (separator if packed else 0)
+        if used + tokens > token_budget:
+            if packed:
+                continue  # a smaller span further down may still fit
+            span.text = truncate_to_tokens(span.text, token_budget, model)
+            tokens = count_tokens(span.text, model)
+        packed.append(Document(page_content=span.text, metadata=span.metadata))
+        used += tokens
+
+    logger.debug(f"Packed {len(docs)} retrieved chunks into {len(packed)} context spans ({used} tokens)")
+    return packed
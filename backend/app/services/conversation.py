@@ -0,0 +1,207 @@
+from langchain_core.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+from backend.app.utils.cache import TTLCache
+from backend.app.utils.config import (
+    HISTORY_MODEL, HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_TOKENS, HISTORY_CACHE_TTL_SECONDS,
+    HISTORY_CACHE_MAX_SESSIONS, HISTORY_MAX_TURNS, HISTORY_MAX_CHARS
+)
+from backend.app.services.context_builder import count_tokens, truncate_to_tokens
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+USER_ROLES = ("user", "human")
+
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "lines"],
+    template="""
+    Progressively summarize a conversation between a website visitor and a support assistant.
+    Keep names, products, codes, numbers and open questions; drop greetings and small talk.
+
+    Current summary:
+    {summary}
+
+    New lines of conversation:
+    {lines}
+
+    New summary:
+    """
+)
+
+CONDENSE_PROMPT = PromptTemplate(
+    input_variables=["history", "question"],
+    template="""
+    Given the conversation below and a follow-up message, rewrite the follow-up as a standalone
+    question that can be understood without the conversation. Resolve pronouns and references
+    ("it", "that plan", "the second one"). If it is already standalone, return it unchanged.
+    Return only the question.
+
+    Conversation:
+    {history}
+
+    Follow-up: {question}
+    Standalone question:
+    """
+)
+
+
+class Conversation(NamedTuple):
+    query: str  # standalone question used for retrieval and the answer cache
+    history: str  # summary of older turns plus the recent window, for the answer prompt
+
+
+def parse_history(chat_history: Optional[Sequence[Sequence[str]]], max_turns: int = HISTORY_MAX_TURNS,
+                  max_chars: int = HISTORY_MAX_CHARS) -> List[Tuple[str, str]]:
+    """
+    (role, text) turns from ChatInput.chat_history. The widget sends
+    ["user", text] / ["bot", text] entries; [question, answer] pairs are also accepted.
+    The history is client-supplied, so only the most recent `max_turns` turns
+    and `max_chars` characters are kept.
+    """
+    turns = []
+    for entry in chat_history or []:
+        if len(entry) != 2 or not entry[1]:
+            continue
+        first, second = entry
+        if first.lower() in USER_ROLES:
+            turns.append(("user", second))
+        elif first.lower() in ("bot", "assistant", "ai"):
+            turns.append(("assistant", second))
+        else:
+            turns.extend((("user", first), ("assistant", second)))
+
+    kept = []
+    remaining = max_chars
+    for role, text in reversed(turns[-max_turns:] if max_turns > 0 else []):
+        if remaining <= 0:
+            break
+        text = text[-remaining:] if len(text) > remaining else text
+        kept.append((role, text))
+        remaining -= len(text)
+    kept.reverse()
+    return kept
+
+
+def _format(turns: Sequence[Tuple[str, str]]) -> str:
+    return "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text in turns)
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ConversationMemory:
+    """
+    Bounded conversation memory for the chat engine.
+    The most recent turns that fit in `token_budget` are kept verbatim; older
+    turns are folded into a running summary, cached per session so each turn
+    is only summarised once. Follow-up messages are condensed into a standalone
+    retrieval query (also cached); with no history, no model is called.
+    """
+
+    def __init__(self, llm=None, model: str = HISTORY_MODEL, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 summary_tokens: int = HISTORY_SUMMARY_TOKENS, cache_ttl: int = HISTORY_CACHE_TTL_SECONDS,
+                 max_sessions: int = HISTORY_CACHE_MAX_SESSIONS):
+        self.llm = llm or ChatOpenAI(model=model, temperature=0, max_tokens=summary_tokens)
+        self.model = model
+        self.token_budget = token_budget
+        self._summaries = TTLCache(cache_ttl, max_sessions)  # session -> (turns summarised, digest, summary)
+        self._queries = TTLCache(cache_ttl, max_sessions)  # (session, conversation digest) -> standalone query
+
+    @staticmethod
+    def session_key(user_id: str, session_id: Optional[str], turns: List[Tuple[str, str]]) -> tuple:
+        # Without a session id, a conversation is recognised by its first turn
+        return user_id, session_id or _digest(*turns[0])
+
+    def parse(self, chat_history) -> List[Tuple[str, str]]:
+        """Bounded turns of a client-supplied history; no single turn is longer than the token budget"""
+        return [(role, truncate_to_tokens(text, self.token_budget, self.model))
+                for role, text in parse_history(chat_history)]
+
+    def split(self, turns: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """(older turns to summarise, recent turns kept verbatim within the token budget)"""
+        used = 0
+        start = len(turns)
+        while start > 0:
+            tokens = count_tokens(turns[start - 1][1], self.model)
+            if used + tokens > self.token_budget and start < len(turns):
+                break
+            used += tokens
+            start -= 1
+        return turns[:start], turns[start:]
+
+    def _summary_plan(self, key: tuple, older: List[Tuple[str, str]]):
+        """(cached summary, turns still to fold in) for the older part of the conversation"""
+        cached = self._summaries.get(key)
+        if cached:
+            count, digest, summary = cached
+            if count <= len(older) and digest == _digest(*(text for _, text in older[:count])):
+                return summary, older[count:]
+        return "", older
+
+    def _remember_summary(self, key: tuple, older: List[Tuple[str, str]], summary: str):
+        self._summaries.set(key, (len(older), _digest(*(text for _, text in older)), summary))
+
+    @staticmethod
+    def _history_text(summary: str, recent: List[Tuple[str, str]]) -> str:
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation: {summary}")
+        if recent:
+            parts.append(_format(recent))
+        return "\n".join(parts)
+
+    def prepare(self, user_id: str, session_id: Optional[str], chat_history, message: str,
+                callbacks: Optional[list] = None) -> Conversation:
+        turns = self.parse(chat_history)
+        if not turns:
+            return Conversation(query=message, history="")
+        config = {"callbacks": callbacks} if callbacks else None
+
+        key = self.session_key(user_id, session_id, turns)
+        older, recent = self.split(turns)
+        summary, pending = self._summary_plan(key, older)
+        if pending:
+            summary = self.llm.invoke(SUMMARY_PROMPT.format(summary=summary or "(none)", lines=_format(pending)),
+                                      config=config).content.strip()
+            self._remember_summary(key, older, summary)
+        history = self._history_text(summary, recent)
+
+        query_key = (key, _digest(history, message))
+        query = self._queries.get(query_key)
+        if query is None:
+            query = self.llm.invoke(CONDENSE_PROMPT.format(history=history, question=message),
+                                    config=config).content.strip() or message
+            self._queries.set(query_key, query)
+        logger.debug(f"Condensed follow-up {message[:80]!r} to {query[:80]!r}")
+        return Conversation(query=query, history=history)
+
+    async def aprepare(self, user_id: str, session_id: Optional[str], chat_history, message: str,
+                       callbacks: Optional[list] = None) -> Conversation:
+        """Async variant of prepare"""
+        turns = self.parse(chat_history)
+        if not turns:
+            return Conversation(query=message, history="")
+        config = {"callbacks": callbacks} if callbacks else None
+
+        key = self.session_key(user_id, session_id, turns)
+        older, recent = self.split(turns)
+        summary, pending = self._summary_plan(key, older)
+        if pending:
+            result = await self.llm.ainvoke(
+                SUMMARY_PROMPT.format(summary=summary or "(none)", lines=_format(pending)), config=config
+            )
+            summary = result.content.strip()
+            self._remember_summary(key, older, summary)
+        history = self._history_text(summary, recent)
+
+        query_key = (key, _digest(history, message))
+        query = self._queries.get(query_key)
+        if query is None:
+            result = await self.llm.ainvoke(CONDENSE_PROMPT.format(history=history, question=message), config=config)
+            query = result.content.strip() or message
+            self._queries.set(query_key, query)
+        logger.debug(f"Condensed follow-up {message[:80]!r} to {query[:80]!r}")
+        return Conversation(query=query, history=history)
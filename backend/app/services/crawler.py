@@ -0,0 +1,451 @@
+from langchain_core.documents import Document
+from backend.app.services.browser_pool import BrowserPool, browser_pool
+from backend.app.utils.helpers import normalize_url, site_host
+from backend.app.utils.config import (
+    CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH, CRAWL_CONCURRENCY, CRAWL_PER_HOST_CONCURRENCY, CRAWL_RESPECT_ROBOTS,
+    CRAWL_USE_SITEMAP, CRAWL_USER_AGENT, CRAWL_PAGE_TIMEOUT_SECONDS, CRAWL_MAX_DELAY_SECONDS,
+    CRAWL_JS_MIN_TEXT_CHARS
+)
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+import asyncio
+import logging
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+
+import httpx
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# Links to files that are never worth rendering as a page
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".zip", ".gz", ".tar", ".rar", ".7z", ".exe", ".dmg", ".jpg", ".jpeg", ".png", ".gif", ".svg",
+    ".webp", ".ico", ".mp3", ".mp4", ".avi", ".mov", ".css", ".js", ".json", ".xml", ".woff", ".woff2"
+)
+
+# Sitemap indexes are followed this many levels deep
+_MAX_SITEMAP_DEPTH = 2
+
+# URLs queued per page of budget: blocked or failing URLs do not use up the budget,
+# but the frontier of a large site stays bounded
+_FRONTIER_FACTOR = 5
+
+# Redirects followed per request, each one checked to stay on the site
+_MAX_REDIRECTS = 5
+
+_HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+_BLOCK_TAGS = _HEADING_TAGS + (
+    "p", "div", "li", "br", "tr", "td", "th", "section", "article", "header", "footer", "main", "aside",
+    "blockquote", "pre", "dd", "dt", "figcaption", "table", "ul", "ol", "form"
+)
+
+
+def _header(headers: dict, name: str):
+    """Case-insensitive response header lookup"""
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+async def get_on_site(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    """
+    GET a URL, following redirects only while they stay on its site.
+    A redirect to another host (e.g. an internal address) is not requested:
+    the redirect response itself is returned, as after too many redirects.
+    """
+    host = site_host(url)
+    response = await client.get(url, follow_redirects=False)
+    for _ in range(_MAX_REDIRECTS):
+        location = response.headers.get("location")
+        if not response.is_redirect or not location:
+            break
+        next_url = urljoin(str(response.url), location)
+        if not next_url.startswith(("http://", "https://")) or site_host(next_url) != host:
+            logger.debug(f"Not following redirect of {url} off the site to {next_url}")
+            break
+        response = await client.get(next_url, follow_redirects=False)
+    return response
+
+
+def extract_links(html: str, base_url: str, soup: Optional[BeautifulSoup] = None) -> List[str]:
+    """Normalised http(s) links of a page, in document order"""
+    soup = soup or BeautifulSoup(html or "", "html.parser")
+    base = soup.find("base", href=True)
+    if base:
+        base_url = normalize_url(base["href"], base_url) or base_url
+    links = []
+    for anchor in soup.find_all("a", href=True):
+        if "nofollow" in (anchor.get("rel") or []):
+            continue
+        link = normalize_url(anchor["href"], base_url)
+        if link:
+            links.append(link)
+    return links
+
+
+def html_to_text(soup: BeautifulSoup) -> str:
+    """Readable text of a parsed page, with markdown-style headings and list items"""
+    for tag in soup(["script", "style", "noscript", "template", "svg", "iframe", "head"]):
+        tag.decompose()
+    for tag in soup.find_all(_BLOCK_TAGS):
+        if tag.name in _HEADING_TAGS:
+            tag.insert(0, "#" * int(tag.name[1]) + " ")
+        elif tag.name == "li":
+            tag.insert(0, "- ")
+        tag.insert_before("\n")
+        tag.insert_after("\n")
+    lines = (re.sub(r"\s+", " ", line).strip() for line in soup.get_text().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _page_from_result(result, url: str) -> Optional[dict]:
+    """Fetcher page dict from a crawl4ai CrawlResult"""
+    if not result or not result.success:
+        return None
+    final_url = result.redirected_url or result.url or url
+    links = None
+    if result.links:
+        links = [link for link in (normalize_url(item.get("href") or "", final_url)
+                                   for item in result.links.get("internal", [])) if link]
+    return {
+        "url": final_url,
+        "status": result.status_code,
+        "html": result.html,
+        "links": links,
+        "content": result.markdown.raw_markdown if result.markdown else "",
+        "etag": _header(result.response_headers, "etag"),
+        "last_modified": _header(result.response_headers, "last-modified")
+    }
+
+
+class BrowserFetcher:
+    """
+    Renders pages on the shared browser pool.
+    fetch() returns {"url", "status", "html", "links", "content", "etag", "last_modified"},
+    or None when the page could not be loaded. The browser follows redirects
+    itself: pages landing off the site are dropped by the crawler, but unlike
+    HttpFetcher's requests they have been loaded.
+    """
+
+    def __init__(self, pool: Optional[BrowserPool] = None):
+        self.pool = pool or browser_pool
+        self.failures = 0  # pages the browser could not load
+
+    async def fetch(self, url: str) -> Optional[dict]:
+        page = _page_from_result(await self.pool.render(url), url)
+        self.failures += page is None
+        return page
+
+
+class HttpFetcher:
+    """
+    Plain HTTP GET + BeautifulSoup, no browser. Pages whose HTML carries too
+    little text (client-rendered apps, "enable JavaScript" shells) or that
+    refuse the request are returned as {"needs_browser": True}; responses that
+    are not HTML pages return None.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, min_text_chars: int = CRAWL_JS_MIN_TEXT_CHARS):
+        self.client = client
+        self.min_text_chars = min_text_chars
+
+    def _parse(self, html: str, url: str) -> dict:
+        soup = BeautifulSoup(html, "html.parser")
+        noscript = " ".join(tag.get_text(" ") for tag in soup.find_all("noscript")).lower()
+        links = extract_links(html, url, soup)
+        content = html_to_text(soup)
+        needs_browser = len(content) < self.min_text_chars or (
+            "javascript" in noscript and len(content) < self.min_text_chars * 4
+        )
+        return {"links": links, "content": content, "needs_browser": needs_browser}
+
+    async def fetch(self, url: str) -> Optional[dict]:
+        try:
+            response = await get_on_site(self.client, url)
+        except httpx.HTTPError as e:
+            logger.debug(f"HTTP fetch of {url} failed, trying the browser: {e}")
+            return {"needs_browser": True}
+        if response.is_redirect:
+            # Leads off the site (or loops); not a page of this site
+            return None
+        if response.status_code in (401, 403, 429) or response.status_code >= 500:
+            # Often bot protection that a real browser gets through
+            return {"needs_browser": True}
+        content_type = response.headers.get("content-type", "")
+        if response.status_code >= 400 or (content_type and "html" not in content_type):
+            return None
+
+        # Parsing a large page takes a while; keep it off the event loop
+        parsed = await asyncio.to_thread(self._parse, response.text, str(response.url))
+        return {
+            "url": str(response.url),
+            "status": response.status_code,
+            "html": response.text,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            **parsed
+        }
+
+
+class HybridFetcher:
+    """Plain HTTP first; the browser pool only for pages that need JavaScript"""
+
+    def __init__(self, http: HttpFetcher, browser: Optional[BrowserFetcher] = None):
+        self.http = http
+        self.browser = browser or BrowserFetcher()
+        self.http_pages = 0
+        self.browser_pages = 0
+
+    @property
+    def failures(self) -> int:
+        return self.browser.failures
+
+    async def fetch(self, url: str) -> Optional[dict]:
+        page = await self.http.fetch(url)
+        if page is None or not page.get("needs_browser"):
+            self.http_pages += page is not None
+            return page
+        page = await self.browser.fetch(url)
+        self.browser_pages += page is not None
+        return page
+
+
+class _HostPolicy:
+    """robots.txt rules and politeness state of one host"""
+
+    def __init__(self, robots: Optional[RobotFileParser], per_host: int, delay: float):
+        self.robots = robots
+        self.slots = asyncio.Semaphore(per_host)
+        self.delay = delay
+        self.next_fetch = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait_turn(self):
+        """Honour the host's Crawl-delay between request starts"""
+        if not self.delay:
+            return
+        async with self.lock:
+            wait = self.next_fetch - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.next_fetch = time.monotonic() + self.delay
+
+
+class SiteCrawler:
+    """
+    Concurrent breadth-first crawler of one website.
+    Up to `concurrency` pages are fetched at once, at most `per_host` of them
+    from the same host. URLs are deduplicated after normalisation, robots.txt
+    rules and Crawl-delay are honoured, and sitemap.xml entries seed the crawl
+    next to the start page. Pages are yielded as Documents as they finish.
+    """
+
+    def __init__(self, fetcher, max_pages: int = CRAWL_MAX_PAGES, max_depth: int = CRAWL_MAX_DEPTH,
+                 concurrency: int = CRAWL_CONCURRENCY, per_host: int = CRAWL_PER_HOST_CONCURRENCY,
+                 respect_robots: bool = CRAWL_RESPECT_ROBOTS, use_sitemap: bool = CRAWL_USE_SITEMAP,
+                 user_agent: str = CRAWL_USER_AGENT, http_client: Optional[httpx.AsyncClient] = None):
+        self.fetcher = fetcher
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.respect_robots = respect_robots
+        self.use_sitemap = use_sitemap
+        self.user_agent = user_agent
+        self.http_client = http_client
+        self._hosts: Dict[str, _HostPolicy] = {}
+        self._host_sitemaps: Dict[str, List[str]] = {}
+        self.errors = 0  # pages of the last crawl that failed to load
+
+    async def _get_text(self, client: httpx.AsyncClient, url: str) -> Optional[str]:
+        try:
+            response = await get_on_site(client, url)
+        except httpx.HTTPError as e:
+            logger.debug(f"Could not fetch {url}: {e}")
+            return None
+        return response.text if response.status_code == 200 else None
+
+    async def _host_policy(self, client: httpx.AsyncClient, url: str) -> _HostPolicy:
+        host = url.split("/")[2]
+        policy = self._hosts.get(host)
+        if policy is not None:
+            return policy
+
+        robots = None
+        sitemaps = []
+        if self.respect_robots or self.use_sitemap:
+            robots_url = f"{url.split('/')[0]}//{host}/robots.txt"
+            text = await self._get_text(client, robots_url)
+            if text is not None:
+                robots = RobotFileParser(robots_url)
+                robots.parse(text.splitlines())
+                sitemaps = robots.site_maps() or []
+        delay = 0.0
+        if robots is not None and self.respect_robots:
+            delay = min(float(robots.crawl_delay(self.user_agent) or 0), CRAWL_MAX_DELAY_SECONDS)
+        # Another task may have set it up meanwhile; keep the first
+        policy = self._hosts.setdefault(host, _HostPolicy(robots if self.respect_robots else None,
+                                                          self.per_host, delay))
+        self._host_sitemaps.setdefault(host, sitemaps)
+        return policy
+
+    async def sitemap_urls(self, client: httpx.AsyncClient, start_url: str) -> List[str]:
+        """
+        Page URLs listed in the site's sitemaps (robots.txt Sitemap: lines, else /sitemap.xml).
+        Only sitemaps on the site's own host are fetched, and redirects are only
+        followed on that host, so a site cannot point the crawler at other
+        (e.g. internal) addresses.
+        """
+        await self._host_policy(client, start_url)
+        root = "/".join(start_url.split("/")[:3])
+        root_host = site_host(start_url)
+        pending = [(url, 0) for url in self._host_sitemaps.get(start_url.split("/")[2]) or [f"{root}/sitemap.xml"]]
+        seen = set()
+        urls = []
+        while pending and len(urls) < self.max_pages * _FRONTIER_FACTOR:
+            sitemap_url, depth = pending.pop(0)
+            sitemap_url = normalize_url(sitemap_url, root)
+            if not sitemap_url or sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            if site_host(sitemap_url) != root_host:
+                logger.debug(f"Ignoring sitemap on another host: {sitemap_url}")
+                continue
+            text = await self._get_text(client, sitemap_url)
+            if not text:
+                continue
+            try:
+                tree = ElementTree.fromstring(text.encode("utf-8"))
+            except ElementTree.ParseError:
+                logger.debug(f"Ignoring unparsable sitemap {sitemap_url}")
+                continue
+            is_index = tree.tag.endswith("sitemapindex")
+            for loc in tree.iter():
+                if not loc.tag.endswith("loc") or not loc.text:
+                    continue
+                if is_index:
+                    if depth + 1 < _MAX_SITEMAP_DEPTH:
+                        pending.append((loc.text.strip(), depth + 1))
+                else:
+                    url = normalize_url(loc.text)
+                    if url:
+                        urls.append(url)
+        return urls
+
+    def _in_scope(self, url: str, root_host: str) -> bool:
+        return site_host(url) == root_host and not url.split("?")[0].lower().endswith(SKIPPED_EXTENSIONS)
+
+    async def crawl(self, start_url: str) -> AsyncIterator[Document]:
+        """
+        Yield one Document per crawled page (metadata: source_url, depth, etag, last_modified).
+        Afterwards `errors` holds the number of pages that failed to load.
+        """
+        start = normalize_url(start_url)
+        if not start:
+            raise ValueError(f"Not a crawlable URL: {start_url}")
+        root_host = site_host(start)
+        self.errors = 0
+        fetcher_failures = getattr(self.fetcher, "failures", 0)
+
+        client = self.http_client or httpx.AsyncClient(
+            headers={"User-Agent": self.user_agent}, timeout=CRAWL_PAGE_TIMEOUT_SECONDS
+        )
+        frontier: asyncio.Queue = asyncio.Queue()
+        results: asyncio.Queue = asyncio.Queue()
+        # Pages crawled ahead of the consumer; workers wait while it is behind
+        buffered = asyncio.Semaphore(self.concurrency)
+        seen: Set[str] = {start}
+        crawled: Set[str] = set()  # the page budget counts these, not URLs tried
+
+        def schedule(url: str, depth: int):
+            if url in seen or len(seen) >= self.max_pages * _FRONTIER_FACTOR or not self._in_scope(url, root_host):
+                return
+            seen.add(url)
+            frontier.put_nowait((url, depth))
+
+        async def visit(url: str, depth: int) -> Optional[Tuple[Document, List[str]]]:
+            if len(crawled) >= self.max_pages:
+                return None  # budget spent; the rest of the frontier drains
+            policy = await self._host_policy(client, url)
+            if policy.robots is not None and not policy.robots.can_fetch(self.user_agent, url):
+                logger.debug(f"robots.txt disallows {url}")
+                return None
+            async with policy.slots:
+                await policy.wait_turn()
+                page = await self.fetcher.fetch(url)
+            if not page:
+                return None
+
+            final_url = normalize_url(page["url"]) or url
+            links = []
+            if depth < self.max_depth:
+                links = page.get("links")
+                if links is None:
+                    links = await asyncio.to_thread(extract_links, page.get("html"), final_url)
+            # Redirects can land on a page another link already reached, or off the site
+            if final_url in crawled or not page.get("content") or len(crawled) >= self.max_pages \
+                    or site_host(final_url) != root_host:
+                return None
+            crawled.add(final_url)
+            return Document(
+                page_content=page["content"],
+                metadata={
+                    "source_url": final_url,
+                    "depth": depth,
+                    "etag": page.get("etag"),
+                    "last_modified": page.get("last_modified")
+                }
+            ), links
+
+        async def worker():
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    visited = await visit(url, depth)
+                    if visited:
+                        document, links = visited
+                        for link in links:
+                            schedule(link, depth + 1)
+                        await buffered.acquire()
+                        await results.put(document)
+                except Exception as e:
+                    logger.warning(f"Failed to crawl {url}: {e}")
+                    self.errors += 1
+                finally:
+                    frontier.task_done()
+
+        async def run():
+            frontier.put_nowait((start, 0))
+            if self.use_sitemap:
+                for url in await self.sitemap_urls(client, start):
+                    schedule(url, 1)
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                await frontier.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await results.put(None)
+
+        runner = asyncio.create_task(run())
+        try:
+            while True:
+                document = await results.get()
+                if document is None:
+                    break
+                buffered.release()
+                yield document
+            await runner
+        finally:
+            if not runner.done():
+                runner.cancel()
+                await asyncio.gather(runner, return_exceptions=True)
+            self.errors += getattr(self.fetcher, "failures", 0) - fetcher_failures
+            if self.http_client is None:
+                await client.aclose()
+        logger.info(f"Crawled {len(crawled)} pages of {start} ({len(seen)} URLs discovered)")
@@ -0,0 +1,147 @@
+from langchain_core.documents import Document
+from backend.app.utils.config import DEDUP_SIMHASH_DISTANCE, BOILERPLATE_MIN_PAGES
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import hashlib
+import re
+
+_WORD = re.compile(r"\w+")
+_SHINGLE_WORDS = 3
+_FINGERPRINT_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase words only, so spacing and punctuation differences do not matter"""
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the word 3-shingles of a text; near-identical texts differ in few bits"""
+    words = normalize_text(text).split()
+    shingles = [" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(max(1, len(words) - _SHINGLE_WORDS + 1))]
+    weights = [0] * _FINGERPRINT_BITS
+    for shingle in shingles:
+        value = _hash64(shingle)
+        for bit in range(_FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+class ChunkDeduplicator:
+    """
+    Exact and near-duplicate detection among the chunks of one document or page.
+    Chunks are compared on normalized text (exact) and on SimHash (near: at
+    most `max_distance` differing bits). Fingerprints are split into
+    max_distance + 1 bands, so any near duplicate shares at least one band
+    and only those candidates are compared.
+    Chunks are never dropped in favour of another page's copy: pages are
+    re-indexed independently, so that copy could later change or disappear.
+    Repetition across pages is handled by BoilerplateFilter.
+    """
+
+    def __init__(self, max_distance: int = DEDUP_SIMHASH_DISTANCE):
+        self.max_distance = max(0, max_distance)
+        self.bands = min(self.max_distance + 1, _FINGERPRINT_BITS)
+        self.band_bits = _FINGERPRINT_BITS // self.bands
+        self._exact: Set[str] = set()  # digests of normalized chunk text kept so far
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self.duplicates = 0
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def _near(self, fingerprint: int) -> bool:
+        return any(hamming_distance(fingerprint, other) <= self.max_distance
+                   for key in self._band_keys(fingerprint) for other in self._buckets.get(key, ()))
+
+    def check(self, text: str) -> bool:
+        """True if the chunk is new (it is then remembered), False when it duplicates one already seen"""
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        if digest in self._exact:
+            self.duplicates += 1
+            return False
+        fingerprint = simhash(text)
+        if self._near(fingerprint):
+            self.duplicates += 1
+            return False
+        self._exact.add(digest)
+        for key in self._band_keys(fingerprint):
+            self._buckets.setdefault(key, []).append(fingerprint)
+        return True
+
+    def filter(self, chunks: List[Document]) -> List[Document]:
+        """Chunks that are not duplicates of an earlier one"""
+        return [chunk for chunk in chunks if self.check(chunk.page_content)]
+
+
+class BoilerplateFilter:
+    """
+    Strips page fragments a site repeats everywhere (navigation, headers,
+    footers, cookie banners) and keeps them once, in a site-wide document.
+    Every crawled page is observed; a line found on `min_pages` different
+    pages is boilerplate, as is any line of the previous site-wide document
+    (`known`), so a refresh strips the same lines from the start. Pages
+    stripped before a line reached the threshold keep it.
+    site_wide_text() holds every line that was stripped from a page, so no
+    content is lost whatever order the pages arrive in.
+    """
+
+    def __init__(self, min_pages: int = BOILERPLATE_MIN_PAGES, known: Sequence[str] = ()):
+        self.min_pages = min_pages
+        self._pages: Dict[str, Set[str]] = {}  # line digest -> pages it was seen on
+        self._text: Dict[str, str] = {}  # line digest -> the line, in first-seen order
+        self._known: Dict[str, str] = {}
+        for line in known:
+            key = self._line_key(line)
+            if key:
+                self._known.setdefault(key, line.strip())
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_pages >= 2
+
+    @staticmethod
+    def _line_key(line: str) -> Optional[str]:
+        normalized = normalize_text(line)
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest() if normalized else None
+
+    def observe(self, page_url: str, text: str):
+        for line in text.splitlines():
+            key = self._line_key(line)
+            if key:
+                pages = self._pages.setdefault(key, set())
+                if len(pages) < self.min_pages:
+                    pages.add(page_url)
+                self._text.setdefault(key, line.strip())
+
+    def _repeated(self, key: str) -> bool:
+        return len(self._pages.get(key, ())) >= self.min_pages
+
+    def is_boilerplate(self, line: str) -> bool:
+        key = self._line_key(line)
+        return key is not None and (key in self._known or self._repeated(key))
+
+    def strip(self, text: str) -> str:
+        if not self.enabled:
+            return text
+        return "\n".join(line for line in text.splitlines() if not self.is_boilerplate(line)).strip()
+
+    def site_wide_text(self, keep_unseen: bool = False) -> str:
+        """
+        The boilerplate lines, once each: known lines still on the site (all
+        of them with `keep_unseen`, e.g. after a partial crawl), then new ones.
+        Known lines keep their order so an unchanged site gives the same text.
+        """
+        if not self.enabled:
+            return "\n".join(self._known.values())  # pages stripped before stay covered
+        lines = [line for key, line in self._known.items() if keep_unseen or key in self._pages]
+        lines.extend(line for key, line in self._text.items() if key not in self._known and self._repeated(key))
+        return "\n".join(lines)
@@ -1,3 +1,4 @@
+from fastapi import UploadFile
 from pathlib import Path
 from typing import List
 from langchain_core.documents import Document
@@ -8,10 +9,11 @@ from langchain_community.document_loaders import (
     CSVLoader,
     TextLoader,
 )
+from backend.app.utils.config import MAX_UPLOAD_SIZE_MB, UPLOAD_CHUNK_SIZE
+import asyncio
 import os
-import tempfile
 
-async def extract_document_content(file_path: str, file_name: str) -> List[Document]:
+def extract_document_content(file_path: str, file_name: str) -> List[Document]:
     """
     Extract content from various document types
     """
@@ -38,24 +40,42 @@ async def extract_document_content(file_path: str, file_name: str) -> List[Docum
     
     return docs
 
-async def process_uploaded_file(file_content: bytes, file_name: str) -> str:
+def extract_file_text(file_path: str, file_name: str) -> str:
     """
-    Process uploaded file and return extracted text
+    Extract and combine the text of a document already on disk.
+    Blocking - run it in a thread from async code.
     """
-    # Create temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file_name).suffix) as tmp_file:
-        tmp_file.write(file_content)
-        tmp_file_path = tmp_file.name
-    
+    docs = extract_document_content(file_path, file_name)
+    return "\n\n".join([doc.page_content for doc in docs])
+
+class UploadTooLarge(ValueError):
+    pass
+
+async def save_upload(file: UploadFile, file_path: str, max_bytes: int = int(MAX_UPLOAD_SIZE_MB * 1024 * 1024),
+                      chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """
+    Copy an upload to file_path chunk by chunk, so it is never held in memory
+    whole (Starlette spools the request body to a temporary file). Raises
+    UploadTooLarge, leaving nothing behind, once more than max_bytes arrive.
+    Returns the number of bytes written.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"{file.filename} is larger than {max_bytes} bytes")
+
+    partial_path = f"{file_path}.part"
+    written = 0
     try:
-        # Extract content
-        docs = await extract_document_content(tmp_file_path, file_name)
-        
-        # Combine all document contents
-        text_content = "\n\n".join([doc.page_content for doc in docs])
-        
-        return text_content
+        with open(partial_path, "wb") as destination:
+            while chunk := await file.read(chunk_size):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"{file.filename} is larger than {max_bytes} bytes")
+                await asyncio.to_thread(destination.write, chunk)
+        os.replace(partial_path, file_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
     finally:
-        # Clean up temporary file
-        if os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
+        await file.close()
+    return written
@@ -0,0 +1,48 @@
+from backend.app.utils.supabase_client import supabase
+from backend.app.utils.cache import TTLCache
+from backend.app.utils.config import ENTITLEMENT_CACHE_TTL_SECONDS, ENTITLEMENT_CACHE_MAX_ENTRIES
+from datetime import datetime, date
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# user_id -> load_entitlements() result; subscription expiry is evaluated on read
+_entitlement_cache = TTLCache(ttl=ENTITLEMENT_CACHE_TTL_SECONDS, max_entries=ENTITLEMENT_CACHE_MAX_ENTRIES)
+
+
+def load_entitlements(user_id: str) -> dict:
+    """
+    Fetch client profile, active subscription with its plan, and active
+    knowledge bases of a user in one round trip (get_saas_entitlements RPC)
+    """
+    result = supabase.rpc("get_saas_entitlements", {"p_user_id": user_id}).execute()
+    data = result.data
+    if isinstance(data, list):
+        data = data[0] if data else None
+    data = data or {}
+    return {
+        "client_id": data.get("client_id"),
+        "subscription": data.get("subscription"),
+        "active_knowledge_base_ids": data.get("active_knowledge_base_ids") or [],
+        "active_url_count": data.get("active_url_count") or 0,
+        "active_document_count": data.get("active_document_count") or 0
+    }
+
+
+def get_entitlements(user_id: str) -> dict:
+    """
+    Cached load_entitlements for read paths; entries live for ENTITLEMENT_CACHE_TTL_SECONDS.
+    Checks that guard writes (plan limits) should call load_entitlements directly.
+    """
+    return _entitlement_cache.get_or_load(user_id, lambda: load_entitlements(user_id))
+
+
+def invalidate_entitlements(user_id: Optional[str] = None):
+    """Forget cached entitlements of one user, or of everyone when user_id is None"""
+    _entitlement_cache.invalidate(user_id)
+
+
+def subscription_end_date(subscription: dict) -> date:
+    end_date = subscription["end_date"]
+    return datetime.strptime(end_date, "%Y-%m-%d").date() if isinstance(end_date, str) else end_date
@@ -2,15 +2,120 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import SupabaseVectorStore
 from langchain.schema import Document
 from backend.app.utils.supabase_client import supabase
-from backend.app.utils.config import SUPABASE_VECTOR_TABLE, SUPABASE_MATCH_FUNC
+from backend.app.services.embedding_cache import get_embedding_cache, create_embeddings, embedding_model_name
+from backend.app.utils.config import (
+    SUPABASE_VECTOR_TABLE, SUPABASE_MATCH_FUNC,
+    EMBEDDING_BATCH_SIZE, VECTOR_INSERT_BATCH_SIZE,
+    INDEX_BATCH_MAX_RETRIES, INDEX_BATCH_RETRY_BACKOFF_SECONDS, DEDUP_ENABLED
+)
+from backend.app.services.dedup import ChunkDeduplicator
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List
+from typing import Callable, List, Optional
 import os
+import time
 
 # Set OpenAI API key
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-def index_documents(knowledge_base_id: str, documents: List[Document]) -> bool:
+def _batched(items: list, size: int):
+    """Yield successive slices of at most `size` items"""
+    size = max(1, size)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _with_retry(operation: Callable, description: str):
+    """Run one batch operation, retrying the whole batch with exponential backoff"""
+    import logging
+    logger = logging.getLogger(__name__)
+
+    attempts = max(0, INDEX_BATCH_MAX_RETRIES) + 1  # the first try plus the retries
+    for attempt in range(1, attempts + 1):
+        try:
+            return operation()
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = INDEX_BATCH_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+            logger.warning(f"{description} failed (attempt {attempt}/{attempts}): {str(e)}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def embed_texts(embedding: OpenAIEmbeddings, texts: List[str], progress: Optional[Callable] = None) -> List[List[float]]:
+    """
+    Embed texts in batches, consulting the embedding cache first so that
+    only text not seen before (for this model) is sent to OpenAI
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+
+    cache = get_embedding_cache()
+    model = embedding_model_name(embedding)
+    vectors = cache.get_many(model, texts) if cache else [None] * len(texts)
+
+    # Embed each distinct uncached text once
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    logger.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} chunks reused, {len(missing)} to embed")
+    if progress:
+        progress(chunks_embedded=len(texts) - len(missing))
+
+    fresh = {}
+    for batch in _batched(missing, EMBEDDING_BATCH_SIZE):
+        batch_vectors = _with_retry(
+            lambda: embedding.embed_documents(batch, chunk_size=len(batch)),
+            f"Embedding batch of {len(batch)} chunks"
+        )
+        if cache:
+            try:
+                cache.put_many(model, batch, batch_vectors)
+            except Exception as e:
+                logger.warning(f"Could not write to embedding cache: {str(e)}")
+        fresh.update(zip(batch, batch_vectors))
+        if progress:
+            progress(chunks_embedded=len(batch))
+        logger.debug(f"Embedded {len(fresh)}/{len(missing)} uncached chunks")
+
+    return [vector if vector is not None else fresh[text] for text, vector in zip(texts, vectors)]
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """Chunks of documents as stored in the vector table"""
+    # start_index lets retrieval merge neighbouring chunks and drop their overlap
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    return splitter.split_documents(documents)
+
+def write_chunks(knowledge_base_id: str, chunks: List[Document], vectors: List[List[float]],
+                 progress: Optional[Callable] = None) -> int:
+    """Insert embedded chunks with bounded multi-row inserts; returns the number written"""
+    import logging
+    logger = logging.getLogger(__name__)
+
+    rows = [
+        {
+            "content": chunk.page_content,
+            "embedding": embedding_vector,
+            "metadata": chunk.metadata,
+            "knowledge_base_id": knowledge_base_id,  # Direct column
+            "user_id": chunk.metadata.get("user_id")  # Direct column, used to scope retrieval
+        }
+        for chunk, embedding_vector in zip(chunks, vectors)
+    ]
+
+    inserted = 0
+    for batch in _batched(rows, VECTOR_INSERT_BATCH_SIZE):
+        _with_retry(
+            lambda: supabase.table(SUPABASE_VECTOR_TABLE).insert(batch).execute(),
+            f"Inserting batch of {len(batch)} vectors"
+        )
+        inserted += len(batch)
+        if progress:
+            progress(vectors_written=len(batch))
+        logger.debug(f"Inserted {inserted}/{len(rows)} vectors")
+    return inserted
+
+def index_documents(knowledge_base_id: str, documents: List[Document], progress: Optional[Callable] = None) -> bool:
+    """
+    Split, embed and store documents for a knowledge base.
+    `progress`, if given, is called with counter increments
+    (chunks_embedded=..., vectors_written=...) as batches complete.
+    """
     import logging
     logger = logging.getLogger(__name__)
     
@@ -23,35 +128,24 @@ def index_documents(knowledge_base_id: str, documents: List[Document]) -> bool:
             logger.error("OPENAI_API_KEY not found in environment")
             raise ValueError("OPENAI_API_KEY not set")
             
-        embedding = OpenAIEmbeddings()
+        embedding = create_embeddings()
         
-        # Custom implementation to handle knowledge_base_id column
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        # Split every document up front so chunks can be embedded and written in batches
+        chunks = split_documents(documents)
+        logger.info(f"{len(documents)} documents split into {len(chunks)} chunks")
+        if DEDUP_ENABLED:
+            # Repeated headers and sections are embedded and stored once
+            deduplicator = ChunkDeduplicator()
+            chunks = deduplicator.filter(chunks)
+            logger.info(f"Dropped {deduplicator.duplicates} duplicate chunks, {len(chunks)} left")
         
-        total_chunks = 0
-        for doc in documents:
-            # Split document into chunks
-            chunks = splitter.split_documents([doc])
-            logger.info(f"Document split into {len(chunks)} chunks")
-            total_chunks += len(chunks)
-            
-            for i, chunk in enumerate(chunks):
-                # Generate embedding
-                embedding_vector = embedding.embed_query(chunk.page_content)
-                
-                # Prepare data for insertion
-                data = {
-                    "content": chunk.page_content,
-                    "embedding": embedding_vector,
-                    "metadata": chunk.metadata,
-                    "knowledge_base_id": knowledge_base_id  # Direct column
-                }
-                
-                # Insert into Supabase
-                result = supabase.table(SUPABASE_VECTOR_TABLE).insert(data).execute()
-                logger.debug(f"Inserted chunk {i+1}/{len(chunks)} with ID: {result.data[0]['id'] if result.data else 'Unknown'}")
+        # Embed chunks in groups, reusing cached vectors for unchanged text
+        vectors = embed_texts(embedding, [chunk.page_content for chunk in chunks], progress)
+        
+        # Write vectors with bounded multi-row inserts
+        inserted = write_chunks(knowledge_base_id, chunks, vectors, progress)
             
-        logger.info(f"Successfully indexed {total_chunks} chunks from {len(documents)} documents")
+        logger.info(f"Successfully indexed {inserted} chunks from {len(documents)} documents")
         return True
     except Exception as e:
         logger.error(f"Error indexing documents: {str(e)}")
@@ -78,7 +172,8 @@ def index_website_content(user_id: str, site_url: str, text: str, knowledge_base
         print(f"Error indexing site content: {e}")
         return False
 
-def index_document_content(user_id: str, document_name: str, text: str, knowledge_base_id: str) -> bool:
+def index_document_content(user_id: str, document_name: str, text: str, knowledge_base_id: str,
+                           progress: Optional[Callable] = None) -> bool:
     try:
         documents = [
             Document(
@@ -91,7 +186,7 @@ def index_document_content(user_id: str, document_name: str, text: str, knowledg
                 }
             )
         ]
-        return index_documents(knowledge_base_id, documents)
+        return index_documents(knowledge_base_id, documents, progress)
     except Exception as e:
         print(f"Error indexing document content: {e}")
         return False
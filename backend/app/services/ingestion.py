@@ -0,0 +1,140 @@
+from backend.app.services.job_queue import JobQueue, WorkerPool
+from backend.app.services.indexer import index_document_content
+from backend.app.services.scrapper import crawl_website
+from backend.app.services.site_sync import sync_website_pages
+from backend.app.services.document_extractor import extract_file_text
+from backend.app.services.answer_cache import invalidate_user_answers
+from backend.app.services.entitlements import invalidate_entitlements
+from backend.app.services.vector_store import invalidate_knowledge_base_vectors
+from backend.app.utils.supabase_client import supabase
+from backend.app.utils.config import INGEST_QUEUE_PATH, INGEST_WORKERS, INGEST_JOB_LEASE_SECONDS
+from typing import Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Job kinds
+JOB_INGEST_URL = "url"
+JOB_INGEST_DOCUMENT = "document"
+JOB_REFRESH_URL = "refresh"
+
+ingestion_queue = JobQueue(INGEST_QUEUE_PATH, lease_seconds=INGEST_JOB_LEASE_SECONDS)
+
+
+def _set_kb_status(knowledge_base_id: str, status: str):
+    try:
+        supabase.table("saas_knowledge_base").update({"status": status}).eq("id", knowledge_base_id).execute()
+    except Exception as e:
+        logger.error(f"Could not set knowledge base {knowledge_base_id} status to {status}: {str(e)}")
+
+
+async def _ingest_website(job: dict, progress) -> dict:
+    payload = job["payload"]
+    # Crawled on the app's event loop, sharing its browser pool; pages are indexed as they arrive
+    crawl_stats = {}
+    stats = await sync_website_pages(
+        job["user_id"], job["knowledge_base_id"], payload["source_url"],
+        crawl_website(payload["source_url"], crawl_stats), progress, crawl_stats=crawl_stats
+    )
+    if job["kind"] == JOB_INGEST_URL and not stats["added"]:
+        raise ValueError("Failed to index website content")
+    if job["kind"] == JOB_REFRESH_URL and not (stats["added"] or stats["updated"] or stats["unchanged"]):
+        raise ValueError("Failed to index website content")
+    return {"pages": stats}
+
+
+async def _ingest_document(job: dict, progress) -> dict:
+    payload = job["payload"]
+    file_path = payload["file_path"]
+    document_name = payload["document_name"]
+    interrupted = False
+    try:
+        # Loaders are blocking, keep them off the event loop
+        text_content = await asyncio.to_thread(extract_file_text, file_path, document_name)
+        if not text_content:
+            raise ValueError("Failed to extract document content")
+
+        indexed = await asyncio.to_thread(
+            index_document_content, job["user_id"], document_name, text_content, job["knowledge_base_id"], progress
+        )
+        if not indexed:
+            raise ValueError("Failed to index document content")
+        return {"characters": len(text_content)}
+    except asyncio.CancelledError:
+        # Shutdown: the job is re-queued on the next start and still needs its file
+        interrupted = True
+        raise
+    finally:
+        if not interrupted and os.path.exists(file_path):
+            os.unlink(file_path)
+
+
+async def process_ingestion_job(job: dict) -> Optional[dict]:
+    """Run one ingestion job and keep the knowledge base status in sync with it"""
+    knowledge_base_id = job["knowledge_base_id"]
+
+    def progress(**increments):
+        ingestion_queue.add_progress(job["id"], **increments)
+
+    if job["kind"] != JOB_REFRESH_URL:
+        _set_kb_status(knowledge_base_id, "processing")
+
+    try:
+        if job["kind"] in (JOB_INGEST_URL, JOB_REFRESH_URL):
+            result = await _ingest_website(job, progress)
+        elif job["kind"] == JOB_INGEST_DOCUMENT:
+            result = await _ingest_document(job, progress)
+        else:
+            raise ValueError(f"Unknown ingestion job kind: {job['kind']}")
+    except Exception:
+        # A failed refresh leaves the previously indexed content in place
+        if job["kind"] != JOB_REFRESH_URL:
+            _set_kb_status(knowledge_base_id, "failed")
+        raise
+    finally:
+        # The indexed content and knowledge base status may have changed either way
+        invalidate_user_answers(job["user_id"])
+        invalidate_entitlements(job["user_id"])
+        invalidate_knowledge_base_vectors(knowledge_base_id)
+
+    _set_kb_status(knowledge_base_id, "active")
+    return result
+
+
+ingestion_workers = WorkerPool(ingestion_queue, process_ingestion_job, concurrency=INGEST_WORKERS)
+
+
+def enqueue_ingestion(kind: str, knowledge_base_id: str, user_id: str, payload: dict,
+                      exclusive: bool = False) -> Optional[dict]:
+    """
+    Queue an ingestion job and wake an idle worker. With `exclusive`, returns
+    None instead when the knowledge base already has a queued or running job.
+    """
+    job = ingestion_queue.enqueue(kind, payload, knowledge_base_id=knowledge_base_id, user_id=user_id,
+                                  exclusive=exclusive)
+    if job is None:
+        return None
+    ingestion_workers.notify()
+    logger.info(f"Queued {kind} job {job['id']} for knowledge base {knowledge_base_id}")
+    return job
+
+
+def job_summary(job: Optional[dict]) -> Optional[dict]:
+    """Public view of a job for status endpoints"""
+    if job is None:
+        return None
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "pages_scraped": job["pages_scraped"],
+        "chunks_embedded": job["chunks_embedded"],
+        "vectors_written": job["vectors_written"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
@@ -0,0 +1,274 @@
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Progress counters tracked for every job
+PROGRESS_FIELDS = ("pages_scraped", "chunks_embedded", "vectors_written")
+
+
+class JobQueue:
+    """
+    Durable local job queue backed by SQLite.
+    Jobs move queued -> running -> completed | failed. A claimed job records
+    this queue's owner id and a heartbeat; jobs whose heartbeat is older than
+    `lease_seconds` (their process crashed) are put back on the queue by
+    requeue_interrupted(), while jobs of other live processes sharing the
+    file are left alone.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 120):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                knowledge_base_id TEXT,
+                user_id TEXT,
+                payload TEXT NOT NULL DEFAULT '{}',
+                status TEXT NOT NULL DEFAULT 'queued',
+                pages_scraped INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                vectors_written INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                owner TEXT,
+                heartbeat_at REAL
+            )
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kb ON jobs(knowledge_base_id, created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, kind: str, payload: dict, knowledge_base_id: str = None, user_id: str = None,
+                exclusive: bool = False) -> Optional[dict]:
+        """
+        Add a job. With `exclusive`, nothing is added (None is returned) while the
+        knowledge base already has a queued or running job; the check and the
+        insert are one statement, so concurrent requests cannot both get through.
+        """
+        job_id = str(uuid.uuid4())
+        values = (job_id, kind, knowledge_base_id, user_id, json.dumps(payload), datetime.utcnow().isoformat())
+        with self._lock:
+            if exclusive:
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (id, kind, knowledge_base_id, user_id, payload, created_at) "
+                    "SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE knowledge_base_id = ? "
+                    "AND status IN ('queued', 'running'))",
+                    (*values, knowledge_base_id)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (id, kind, knowledge_base_id, user_id, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    values
+                )
+            self._conn.commit()
+        return self.get(job_id) if cursor.rowcount else None
+
+    def claim_next(self) -> Optional[dict]:
+        """
+        Atomically move the oldest queued job to running and return it.
+        A single conditional UPDATE, so processes sharing the database file
+        can never claim the same job (needs SQLite 3.35+ for RETURNING).
+        """
+        with self._lock:
+            job = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1) "
+                "AND status = 'queued' RETURNING *",
+                (datetime.utcnow().isoformat(), self.owner_id, time.time())
+            ).fetchone()
+            self._conn.commit()
+        return self._to_dict(job)
+
+    def add_progress(self, job_id: str, **increments):
+        updates = {field: int(value) for field, value in increments.items() if field in PROGRESS_FIELDS and value}
+        if not updates:
+            return
+        assignments = ", ".join(f"{field} = {field} + ?" for field in updates)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*updates.values(), job_id))
+            self._conn.commit()
+
+    def complete(self, job_id: str, result: dict = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'completed', result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result) if result is not None else None, datetime.utcnow().isoformat(), job_id)
+            )
+            self._conn.commit()
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, datetime.utcnow().isoformat(), job_id)
+            )
+            self._conn.commit()
+
+    def heartbeat(self):
+        """Renew the lease of the jobs this queue's process is running"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+                (time.time(), self.owner_id)
+            )
+            self._conn.commit()
+
+    def requeue_interrupted(self) -> int:
+        """Put running jobs whose lease expired (their process stopped) back on the queue"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, heartbeat_at = NULL, "
+                "pages_scraped = 0, chunks_embedded = 0, vectors_written = 0 "
+                "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (time.time() - self.lease_seconds,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def latest_for_knowledge_base(self, knowledge_base_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE knowledge_base_id = ? ORDER BY created_at DESC LIMIT 1",
+                (knowledge_base_id,)
+            ).fetchone()
+        return self._to_dict(row)
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of asyncio workers draining a JobQueue.
+    The pool size bounds how many jobs are processed concurrently. A
+    separate task renews the pool's job leases and re-queues the jobs of
+    processes that stopped renewing theirs.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[dict], Awaitable[Optional[dict]]],
+                 concurrency: int = 2, poll_interval: float = 5.0):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"job-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._keep_leases(), name="job-leases"))
+        logger.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after a job has been enqueued (safe to call from any thread)"""
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                self._wakeup.set()
+                return
+        except RuntimeError:
+            pass
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _keep_leases(self):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while True:
+            try:
+                self.queue.heartbeat()
+                requeued = self.queue.requeue_interrupted()
+                if requeued:
+                    logger.info(f"Re-queued {requeued} interrupted jobs")
+                    self.notify()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to renew job leases: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                await self._run_next(index)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A queue error (e.g. "database is locked") must not end the worker
+                logger.exception(f"Worker {index} hit a job queue error, retrying in {self.poll_interval}s")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run_next(self, index: int):
+        # Clear before claiming so an enqueue racing with an empty claim still wakes us
+        self._wakeup.clear()
+        job = self.queue.claim_next()
+        if job is None:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        logger.info(f"Worker {index} processing {job['kind']} job {job['id']}")
+        try:
+            result = await self.handler(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            self.queue.fail(job["id"], str(e))
+            return
+        self.queue.complete(job["id"], result)
+        logger.info(f"Job {job['id']} completed")
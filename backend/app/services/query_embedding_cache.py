@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from typing import List, Optional
+import asyncio
+import logging
+import re
+import threading
+
+from backend.app.services.embedding_cache import EmbeddingCache, embedding_cache_key, get_embedding_cache
+from backend.app.utils.config import QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_SHARED
+
+logger = logging.getLogger(__name__)
+
+
+# Query vectors live apart from chunk vectors in the shared cache
+QUERY_NAMESPACE = "query"
+
+
+def normalize_query(text: str) -> str:
+    """Case and whitespace differences should not cost another embedding call"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _namespace(model: str) -> str:
+    return f"{QUERY_NAMESPACE}:{model}"
+
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache of chat query embeddings.
+    Keys are (embedding model, normalised query text), and the normalised
+    text is what gets embedded, so every casing of a question maps to the
+    same vector. With a `backend` (the persistent EmbeddingCache) misses fall
+    through to it under a separate "query:" namespace, so workers sharing the
+    cache file reuse each other's query embeddings.
+    """
+
+    def __init__(self, max_entries: int = 1000, backend: Optional[EmbeddingCache] = None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return vector
+
+    def _put_local(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_backend(self, model: str, text: str, key: str) -> Optional[List[float]]:
+        if self.backend is None:
+            return None
+        try:
+            vector = self.backend.get_many(model, [text])[0]
+        except Exception as e:
+            logger.warning(f"Query embedding cache backend lookup failed: {str(e)}")
+            return None
+        if vector is not None:
+            self._put_local(key, vector)
+            with self._lock:
+                self.backend_hits += 1
+        return vector
+
+    def _store(self, model: str, text: str, key: str, vector: List[float]):
+        self._put_local(key, vector)
+        if self.backend is not None:
+            try:
+                self.backend.put_many(model, [text], [vector])
+            except Exception as e:
+                logger.warning(f"Query embedding cache backend write failed: {str(e)}")
+
+    def embed_query(self, embedding, model: str, text: str) -> List[float]:
+        """Return the embedding of `text`, calling `embedding.embed_query` only on a miss"""
+        model = _namespace(model)
+        text = normalize_query(text)
+        key = embedding_cache_key(model, text)
+        vector = self._get_local(key)
+        if vector is None:
+            vector = self._get_backend(model, text, key)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            vector = embedding.embed_query(text)
+            self._store(model, text, key, vector)
+        return vector
+
+    async def aembed_query(self, embedding, model: str, text: str) -> List[float]:
+        """Async variant of embed_query; the disk backend is consulted off the event loop"""
+        model = _namespace(model)
+        text = normalize_query(text)
+        key = embedding_cache_key(model, text)
+        vector = self._get_local(key)
+        if vector is None and self.backend is not None:
+            vector = await asyncio.to_thread(self._get_backend, model, text, key)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            vector = await embedding.aembed_query(text)
+            if self.backend is not None:
+                await asyncio.to_thread(self._store, model, text, key, vector)
+            else:
+                self._put_local(key, vector)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "entries": len(self._entries)
+            }
+
+
+query_embedding_cache: Optional[QueryEmbeddingCache] = QueryEmbeddingCache(
+    max_entries=QUERY_EMBEDDING_CACHE_SIZE,
+    backend=get_embedding_cache() if QUERY_EMBEDDING_CACHE_SHARED else None
+) if QUERY_EMBEDDING_CACHE_SIZE > 0 else None
@@ -5,56 +5,118 @@ if sys.platform == "win32":
     configure_windows_event_loop()
 
 import asyncio
-from crawl4ai import AsyncWebCrawler
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+import httpx
+from langchain_core.documents import Document
+from backend.app.services.browser_pool import browser_pool
+from backend.app.services.crawler import BrowserFetcher, HttpFetcher, HybridFetcher, SiteCrawler
+from backend.app.utils.config import CRAWL_HTTP_FIRST, CRAWL_USER_AGENT, CRAWL_PAGE_TIMEOUT_SECONDS
 
-async def scrape_website_text(url: str) -> str:
+async def crawl_website(url: str, stats: Optional[dict] = None) -> AsyncIterator[Document]:
+    """
+    Crawl a website, yielding one Document per page as soon as it is fetched,
+    with the page URL in metadata["source_url"] (limits, concurrency and
+    politeness: CRAWL_* settings). Pages are fetched over plain HTTP and only
+    rendered on the shared browser pool when they need JavaScript. The crawl
+    runs ahead of a slow consumer by at most CRAWL_CONCURRENCY pages.
+    Once the crawl completes, `stats` (if given) receives "pages" and "errors"
+    (pages that failed to load).
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+
+    logger.info(f"Starting to crawl URL: {url}")
+    async with httpx.AsyncClient(headers={"User-Agent": CRAWL_USER_AGENT},
+                                 timeout=CRAWL_PAGE_TIMEOUT_SECONDS) as client:
+        fetcher = HybridFetcher(HttpFetcher(client)) if CRAWL_HTTP_FIRST else BrowserFetcher()
+        crawler = SiteCrawler(fetcher, http_client=client)
+        pages = characters = 0
+        crawl = crawler.crawl(url)
+        try:
+            async for document in crawl:
+                pages += 1
+                characters += len(document.page_content)
+                yield document
+        finally:
+            # Stop the crawl's workers now if the consumer went away early
+            await crawl.aclose()
+        if stats is not None:
+            stats.update(pages=pages, errors=crawler.errors)
+    rendered = f", {fetcher.browser_pages} rendered in the browser" if CRAWL_HTTP_FIRST else ""
+    logger.info(f"Successfully crawled {pages} pages ({characters} characters{rendered})")
+
+async def scrape_website_documents(url: str) -> List[Document]:
     """
-    Scrape website content using crawl4ai
+    Crawl a website and return one Document per page (see crawl_website)
     """
     import logging
     logger = logging.getLogger(__name__)
     
     try:
-        logger.info(f"Starting to scrape URL: {url}")
-        async with AsyncWebCrawler() as crawler:
-            logger.debug("Crawler initialized")
-            result = await crawler.arun(
-                url=url,
-                deep_crawl="bfs",  # breadth-first search
-                max_pages=20,  # increase as needed
-                max_depth=3,  # increase if needed
-                timeout=30
-            )
-            logger.debug(f"Scraping result: {result}")
-            
-            if result and result.markdown:
-                content = result.markdown.raw_markdown
-                logger.info(f"Successfully scraped {len(content)} characters")
-                return content
-            else:
-                logger.warning("No markdown content found in result")
-                return ""
+        return [document async for document in crawl_website(url)]
     except Exception as e:
-        logger.error(f"Error scraping {url}: {str(e)}")
+        logger.error(f"Error crawling {url}: {str(e)}")
         logger.error(f"Error type: {type(e).__name__}")
         import traceback
         logger.error(traceback.format_exc())
-        raise  # Re-raise the exception instead of returning empty string
+        raise  # Re-raise the exception instead of returning empty list
+
+async def scrape_website_pages(url: str) -> List[dict]:
+    """
+    Crawl a website and return one entry per page:
+    {"url", "content", "etag", "last_modified"}
+    """
+    return [
+        {
+            "url": document.metadata["source_url"],
+            "content": document.page_content,
+            "etag": document.metadata.get("etag"),
+            "last_modified": document.metadata.get("last_modified")
+        }
+        for document in await scrape_website_documents(url)
+    ]
+
+async def scrape_website_text(url: str) -> str:
+    """
+    Crawl a website (plain HTTP, with the browser pool for pages that need
+    JavaScript; see CRAWL_HTTP_FIRST) and return the text of all its pages joined
+    """
+    pages = await scrape_website_pages(url)
+    return "\n\n".join(page["content"] for page in pages)
+
+def _run_sync(make_coroutine: Callable[[], Awaitable]):
+    """
+    Run a scrape from synchronous code. Inside the app the coroutine is handed
+    to the event loop that owns the browser pool; standalone (scripts) a
+    temporary loop runs it and closes the browsers it started.
+    """
+    loop = browser_pool.loop
+    if loop is not None and loop.is_running():
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("Use the async scrape functions from the event loop")
+        return asyncio.run_coroutine_threadsafe(make_coroutine(), loop).result()
+
+    async def standalone():
+        browser_pool.start()
+        try:
+            return await make_coroutine()
+        finally:
+            await browser_pool.close()
+
+    return asyncio.run(standalone())
 
 def scrape_website_text_sync(url: str) -> str:
     """
     Synchronous wrapper for the async scrape function
     """
-    # Check if we're already in an event loop
-    try:
-        loop = asyncio.get_running_loop()
-        # If we're in a loop, create a new thread to run the async function
-        import concurrent.futures
-        import functools
-        
-        with concurrent.futures.ThreadPoolExecutor() as pool:
-            future = pool.submit(asyncio.run, scrape_website_text(url))
-            return future.result()
-    except RuntimeError:
-        # No event loop running, we can use asyncio.run directly
-        return asyncio.run(scrape_website_text(url))
+    return _run_sync(lambda: scrape_website_text(url))
+
+def scrape_website_pages_sync(url: str) -> List[dict]:
+    """
+    Synchronous wrapper for the async per-page crawl
+    """
+    return _run_sync(lambda: scrape_website_pages(url))
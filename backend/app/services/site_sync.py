@@ -0,0 +1,313 @@
+from langchain.schema import Document
+from backend.app.services.dedup import BoilerplateFilter, ChunkDeduplicator
+from backend.app.services.embedding_cache import create_embeddings
+from backend.app.services.indexer import embed_texts, split_documents, write_chunks
+from backend.app.utils.supabase_client import supabase
+from backend.app.utils.config import (
+    SUPABASE_VECTOR_TABLE, EMBEDDING_BATCH_SIZE, INGEST_PIPELINE_QUEUE_SIZE, DEDUP_ENABLED,
+    SYNC_REMOVE_MIN_COVERAGE
+)
+from datetime import datetime
+from typing import AsyncIterable, Awaitable, Callable, List, Optional
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGES_TABLE = "saas_knowledge_base_pages"
+SITE_WIDE_FRAGMENT = "#site-wide"
+
+_DONE = object()  # end of a pipeline queue
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _page_unchanged(page: dict, stored: dict) -> bool:
+    """
+    A page is unchanged when its content hash matches the stored state.
+    The body is always downloaded, so the ETag is only recorded: servers that
+    keep a fixed ETag would otherwise hide content changes.
+    """
+    return page["content_hash"] == stored.get("content_hash")
+
+
+def _select_all(query: Callable, page_size: int = 1000) -> List[dict]:
+    """
+    All rows of a select, fetched in pages: PostgREST caps each response
+    (1000 rows by default). `query()` builds the select, ordered by a unique key.
+    """
+    rows = []
+    while True:
+        result = query().range(len(rows), len(rows) + page_size - 1).execute()
+        batch = result.data or []
+        rows.extend(batch)
+        if len(batch) < page_size:
+            return rows
+
+
+def _page_vector_ids(knowledge_base_id: str, page_url: str) -> List[str]:
+    rows = _select_all(lambda: supabase.table(SUPABASE_VECTOR_TABLE)
+                       .select("id")
+                       .eq("knowledge_base_id", knowledge_base_id)
+                       .eq("metadata->>source_url", page_url)
+                       .order("id"))
+    return [row["id"] for row in rows]
+
+
+def _delete_vectors(vector_ids: List[str]):
+    for start in range(0, len(vector_ids), 200):
+        supabase.table(SUPABASE_VECTOR_TABLE)\
+            .delete()\
+            .in_("id", vector_ids[start:start + 200])\
+            .execute()
+
+
+def get_stored_pages(knowledge_base_id: str) -> dict:
+    """Return the last crawled state of a knowledge base, keyed by page URL"""
+    rows = _select_all(lambda: supabase.table(PAGES_TABLE)
+                       .select("url, content_hash, etag, last_modified")
+                       .eq("knowledge_base_id", knowledge_base_id)
+                       .order("url"))
+    return {row["url"]: row for row in rows}
+
+
+def site_wide_url(site_url: str) -> str:
+    """Page URL under which a site's boilerplate is stored once"""
+    return f"{site_url.split('#')[0]}{SITE_WIDE_FRAGMENT}"
+
+
+def _stored_page_text(knowledge_base_id: str, page_url: str) -> str:
+    """Text of a stored page, rebuilt from its chunks and their start_index"""
+    rows = _select_all(lambda: supabase.table(SUPABASE_VECTOR_TABLE)
+                       .select("id, content, start_index:metadata->>start_index")
+                       .eq("knowledge_base_id", knowledge_base_id)
+                       .eq("metadata->>source_url", page_url)
+                       .order("id"))
+    text = ""
+    for row in sorted(rows, key=lambda row: int(row.get("start_index") or 0)):
+        start = int(row.get("start_index") or 0)
+        # Chunks overlap; where the splitter dropped a separator, it was a line break
+        text = text[:start].ljust(start, "\n") + row["content"]
+    return text
+
+
+def _page_document(user_id: str, knowledge_base_id: str, site_url: str, page: dict) -> Document:
+    metadata = {
+        "user_id": user_id,
+        "source_url": page["url"],
+        "site_url": site_url,
+        "document_name": None,
+        "knowledge_base_id": knowledge_base_id
+    }
+    if page["url"] == site_wide_url(site_url):
+        metadata["site_wide"] = True
+    return Document(page_content=page["content"], metadata=metadata)
+
+
+def _store_page(knowledge_base_id: str, page: dict, replaced: bool, chunks: List[Document],
+                vectors: List[List[float]], progress: Optional[Callable] = None):
+    """Write a page's new vectors, then drop the old ones so the page never goes missing"""
+    old_vector_ids = _page_vector_ids(knowledge_base_id, page["url"]) if replaced else []
+    write_chunks(knowledge_base_id, chunks, vectors, progress)
+    _delete_vectors(old_vector_ids)
+
+    supabase.table(PAGES_TABLE).upsert({
+        "knowledge_base_id": knowledge_base_id,
+        "url": page["url"],
+        "content_hash": page["content_hash"],
+        "etag": page.get("etag"),
+        "last_modified": page.get("last_modified"),
+        "last_crawled_at": datetime.utcnow().isoformat()
+    }, on_conflict="knowledge_base_id,url").execute()
+
+
+async def _run_stages(*stages: Awaitable):
+    """Run pipeline stages together; if one fails the others are cancelled"""
+    tasks = [asyncio.create_task(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def sync_website_pages(user_id: str, knowledge_base_id: str, site_url: str,
+                             documents: AsyncIterable[Document], progress: Optional[Callable] = None,
+                             queue_size: int = INGEST_PIPELINE_QUEUE_SIZE, crawl_stats: Optional[dict] = None,
+                             min_coverage: float = SYNC_REMOVE_MIN_COVERAGE) -> dict:
+    """
+    Bring the vectors of a URL knowledge base in line with a crawl, as it runs.
+    Pages from `documents` (crawl_website) flow through chunk, embed and write
+    stages connected by queues of at most `queue_size` pages, so a page is
+    being embedded while the next is chunked and the previous written, and
+    memory stays bounded however large the site. Only new or changed pages are
+    re-chunked and re-embedded; once the crawl completes, vectors of pages
+    that are no longer reachable are deleted.
+    With DEDUP_ENABLED, lines repeated across pages (navigation, footers) are
+    stripped from changed pages and indexed once under site_wide_url(), and
+    duplicate chunks within a page are dropped. If the crawl had fetch errors
+    (`crawl_stats["errors"]`, filled in by crawl_website) or did not report
+    them, unreached pages are only deleted when it reached `min_coverage` of
+    the stored pages, so a partly failing site does not lose its content.
+    """
+    stored = await asyncio.to_thread(get_stored_pages, knowledge_base_id)
+    boilerplate_url = site_wide_url(site_url)
+    stored_boilerplate = stored.pop(boilerplate_url, None)
+    boilerplate = None
+    if DEDUP_ENABLED or stored_boilerplate:
+        # Lines stripped from unchanged pages last time are still only in the site-wide page
+        known = await asyncio.to_thread(_stored_page_text, knowledge_base_id, boilerplate_url) \
+            if stored_boilerplate else ""
+        boilerplate = BoilerplateFilter(known=known.splitlines()) if DEDUP_ENABLED \
+            else BoilerplateFilter(min_pages=0, known=known.splitlines())
+    duplicates = 0
+    stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    crawled_urls = set()
+
+    to_chunk: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    to_embed: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    to_write: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def split_page(page: dict) -> List[Document]:
+        nonlocal duplicates
+        if boilerplate:
+            page = dict(page, content=boilerplate.strip(page["content"]))
+        chunks = split_documents([_page_document(user_id, knowledge_base_id, site_url, page)])
+        if not DEDUP_ENABLED:
+            return chunks
+        deduplicator = ChunkDeduplicator()
+        chunks = deduplicator.filter(chunks)
+        duplicates += deduplicator.duplicates
+        return chunks
+
+    async def crawl_stage():
+        async for document in documents:
+            if progress:
+                progress(pages_scraped=1)
+            await to_chunk.put(document)
+        await to_chunk.put(_DONE)
+
+    async def chunk_stage():
+        while (document := await to_chunk.get()) is not _DONE:
+            page = {
+                "url": document.metadata["source_url"],
+                "content": document.page_content,
+                "etag": document.metadata.get("etag"),
+                "last_modified": document.metadata.get("last_modified"),
+                "content_hash": content_hash(document.page_content)
+            }
+            if not stored and not crawled_urls:
+                # First per-page sync (new KB, or one indexed as a single blob) - start clean
+                await asyncio.to_thread(
+                    lambda: supabase.table(SUPABASE_VECTOR_TABLE).delete()
+                    .eq("knowledge_base_id", knowledge_base_id).execute()
+                )
+            crawled_urls.add(page["url"])
+            if boilerplate:
+                boilerplate.observe(page["url"], page["content"])
+
+            previous = stored.get(page["url"])
+            if previous and _page_unchanged(page, previous):
+                stats["unchanged"] += 1
+                continue
+            chunks = await asyncio.to_thread(split_page, page)
+            await to_embed.put((page, previous is not None, chunks))
+        await to_embed.put(_DONE)
+
+    async def embed_stage():
+        embedding = create_embeddings()
+        done = False
+        while not done:
+            item = await to_embed.get()
+            if item is _DONE:
+                break
+            # Small pages that are already waiting share one embedding batch
+            batch = [item]
+            while sum(len(chunks) for _, _, chunks in batch) < EMBEDDING_BATCH_SIZE and not to_embed.empty():
+                item = to_embed.get_nowait()
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            texts = [chunk.page_content for _, _, chunks in batch for chunk in chunks]
+            try:
+                vectors = await asyncio.to_thread(embed_texts, embedding, texts, progress)
+            except Exception as e:
+                logger.error(f"Failed to embed {len(batch)} pages, keeping previous versions: {str(e)}")
+                stats["failed"] += len(batch)
+                continue
+            offset = 0
+            for page, replaced, chunks in batch:
+                await to_write.put((page, replaced, chunks, vectors[offset:offset + len(chunks)]))
+                offset += len(chunks)
+        await to_write.put(_DONE)
+
+    async def write_stage():
+        while (item := await to_write.get()) is not _DONE:
+            page, replaced, chunks, vectors = item
+            try:
+                await asyncio.to_thread(_store_page, knowledge_base_id, page, replaced, chunks, vectors, progress)
+            except Exception as e:
+                logger.error(f"Failed to index page {page['url']}, keeping previous version: {str(e)}")
+                stats["failed"] += 1
+                continue
+            stats["updated" if replaced else "added"] += 1
+
+    try:
+        await _run_stages(crawl_stage(), chunk_stage(), embed_stage(), write_stage())
+    finally:
+        # Close the crawl right away (workers, HTTP client) if a stage failed
+        aclose = getattr(documents, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if not crawled_urls:
+        raise ValueError("Failed to scrape website content")
+
+    # Pages that disappeared from the site
+    def remove_pages(page_urls):
+        for page_url in page_urls:
+            _delete_vectors(_page_vector_ids(knowledge_base_id, page_url))
+            supabase.table(PAGES_TABLE)\
+                .delete()\
+                .eq("knowledge_base_id", knowledge_base_id)\
+                .eq("url", page_url)\
+                .execute()
+
+    removed = set(stored) - crawled_urls
+    crawl_complete = crawl_stats is not None and crawl_stats.get("errors") == 0
+    kept_unreached = bool(removed) and not crawl_complete and len(crawled_urls) < min_coverage * len(stored)
+    if kept_unreached:
+        logger.warning(f"Crawl of {site_url} reached {len(crawled_urls)} of {len(stored)} known pages with errors; "
+                       f"keeping {len(removed)} unreached pages")
+        removed = set()
+
+    # Boilerplate is indexed once, after every page has been seen
+    if boilerplate:
+        text = boilerplate.site_wide_text(keep_unseen=kept_unreached)
+        page = {"url": boilerplate_url, "content": text, "content_hash": content_hash(text)}
+        if not text:
+            if stored_boilerplate:
+                await asyncio.to_thread(remove_pages, [boilerplate_url])
+        elif not stored_boilerplate or not _page_unchanged(page, stored_boilerplate):
+            chunks = split_documents([_page_document(user_id, knowledge_base_id, site_url, page)])
+            try:
+                vectors = await asyncio.to_thread(embed_texts, create_embeddings(), [c.page_content for c in chunks])
+                await asyncio.to_thread(_store_page, knowledge_base_id, page, stored_boilerplate is not None,
+                                        chunks, vectors)
+            except Exception as e:
+                # Pages already stripped of these lines would lose them - fail the sync so it is retried
+                raise RuntimeError(f"Failed to index site-wide content of {site_url}: {str(e)}") from e
+        logger.info(f"Indexed {len(text.splitlines())} site-wide lines of {knowledge_base_id} once, "
+                    f"skipped {duplicates} duplicate chunks")
+
+    await asyncio.to_thread(remove_pages, removed)
+    stats["removed"] = len(removed)
+
+    logger.info(f"Synced knowledge base {knowledge_base_id}: {stats}")
+    return stats
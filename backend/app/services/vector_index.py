@@ -0,0 +1,87 @@
+from backend.app.utils.supabase_client import supabase
+from backend.app.utils.config import (
+    VECTOR_INDEX_METHOD, VECTOR_INDEX_PRECISION, VECTOR_HNSW_M, VECTOR_HNSW_EF_CONSTRUCTION,
+    VECTOR_INDEX_REBUILD_GROWTH
+)
+from typing import Optional
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+INDEX_METHODS = ("ivfflat", "hnsw")
+INDEX_PRECISIONS = ("full", "half")
+
+
+def ivfflat_lists(row_count: int) -> int:
+    """pgvector's guidance: rows / 1000 lists up to 1M rows, sqrt(rows) beyond"""
+    if row_count <= 1_000_000:
+        return max(10, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+def ivfflat_probes(lists: int) -> int:
+    """Starting point for ivfflat.probes: sqrt(lists)"""
+    return max(1, int(math.sqrt(lists)))
+
+
+def get_index_stats() -> dict:
+    result = supabase.rpc("get_saas_vector_index_stats", {}).execute()
+    data = result.data
+    if isinstance(data, list):
+        data = data[0] if data else None
+    return data or {}
+
+
+def search_precision_mismatch(stats: dict, search_precision: str) -> Optional[str]:
+    """
+    Why searches at `search_precision` cannot use the built index, or None.
+    A halfvec search against a full-precision index (or the reverse) silently
+    becomes a sequential scan.
+    """
+    if not stats.get("index_definition"):
+        return None
+    built_precision = ((stats.get("last_build") or {}).get("params") or {}).get("precision", "full")
+    if built_precision != search_precision:
+        return (f"VECTOR_SEARCH_PRECISION is {search_precision} but the embedding index is {built_precision}; "
+                f"searches will not use the index (rebuild it or change the setting)")
+    return None
+
+
+def rebuild_reason(stats: dict, method: str = VECTOR_INDEX_METHOD, precision: str = VECTOR_INDEX_PRECISION,
+                   growth: float = VECTOR_INDEX_REBUILD_GROWTH) -> Optional[str]:
+    """Why the embedding index should be rebuilt, or None if it is still adequate"""
+    row_count = stats.get("row_count") or 0
+    last_build = stats.get("last_build")
+
+    if not stats.get("index_definition"):
+        return "embedding index is missing"
+    if not last_build:
+        return "no recorded build (initial index from database_setup.sql)"
+    if last_build["method"] != method:
+        return f"index method is {last_build['method']}, configured {method}"
+    built_precision = (last_build.get("params") or {}).get("precision", "full")
+    if built_precision != precision:
+        return f"index precision is {built_precision}, configured {precision}"
+    if row_count > max(last_build["row_count"], 1) * growth:
+        return f"table grew from {last_build['row_count']} to {row_count} rows"
+    return None
+
+
+def rebuild_index(method: str = VECTOR_INDEX_METHOD, row_count: int = 0,
+                  precision: str = VECTOR_INDEX_PRECISION) -> dict:
+    """Rebuild the embedding index with parameters derived from the table size"""
+    if method not in INDEX_METHODS:
+        raise ValueError(f"Unknown vector index method: {method}")
+    if precision not in INDEX_PRECISIONS:
+        raise ValueError(f"Unknown vector index precision: {precision}")
+    params = {
+        "p_method": method,
+        "p_lists": ivfflat_lists(row_count),
+        "p_m": VECTOR_HNSW_M,
+        "p_ef_construction": VECTOR_HNSW_EF_CONSTRUCTION,
+        "p_precision": precision
+    }
+    logger.info(f"Rebuilding embedding index: {params}")
+    result = supabase.rpc("rebuild_saas_vector_index", params).execute()
+    return result.data
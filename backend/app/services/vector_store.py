@@ -0,0 +1,601 @@
+from langchain_core.documents import Document
+from backend.app.utils.supabase_client import supabase
+from backend.app.services.vector_index import INDEX_PRECISIONS, get_index_stats, search_precision_mismatch
+from backend.app.utils.config import (
+    SUPABASE_VECTOR_TABLE, SUPABASE_SCOPED_MATCH_FUNC, SUPABASE_TEXT_SEARCH_FUNC, VECTOR_SEARCH_MODE,
+    VECTOR_IVFFLAT_PROBES, VECTOR_HNSW_EF_SEARCH, VECTOR_STORE_BACKEND, LOCAL_VECTOR_STORE_PATH,
+    LOCAL_VECTOR_STORE_WARM_KBS, LOCAL_VECTOR_ANN_MIN_ROWS, LOCAL_VECTOR_ANN_PROBES, LOCAL_VECTOR_PRECISION,
+    VECTOR_SEARCH_PRECISION, VECTOR_RERANK_FACTOR, HYBRID_SEARCH_ENABLED, HYBRID_CANDIDATES, HYBRID_RRF_K
+)
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _chunk_key(doc: Document) -> tuple:
+    return (doc.metadata or {}).get("knowledge_base_id"), doc.page_content
+
+
+def valid_knowledge_base_ids(knowledge_base_ids: Sequence[str]) -> List[str]:
+    """
+    Canonical form of the requested knowledge base ids. They come from request
+    bodies (also on the public chat endpoints), so anything that is not a UUID
+    is dropped before it reaches a query or a file path.
+    """
+    ids = []
+    for knowledge_base_id in knowledge_base_ids:
+        try:
+            ids.append(str(uuid.UUID(str(knowledge_base_id))))
+        except ValueError:
+            logger.warning(f"Ignoring malformed knowledge base id: {str(knowledge_base_id)[:64]!r}")
+    return ids
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """
+    Merge ranked result lists by reciprocal rank: a chunk scores the sum of
+    1 / (rrf_k + rank) over the lists it appears in. Only ranks are used, so
+    cosine similarities and text ranks need no common scale.
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            if key in docs:
+                # Keep the vector hit's metadata (similarity), add what the other retriever knew
+                docs[key].metadata = {**doc.metadata, **docs[key].metadata}
+            else:
+                docs[key] = Document(page_content=doc.page_content, metadata=dict(doc.metadata or {}))
+
+    fused = sorted(scores, key=scores.get, reverse=True)[:k]
+    for key in fused:
+        docs[key].metadata["rrf_score"] = scores[key]
+    return [docs[key] for key in fused]
+
+
+class ChunkStore(ABC):
+    """
+    Retrieval backend interface used by the chat engine.
+    Supabase (saas_knowledge_base_vectors) is always the system of record;
+    backends only differ in where the top-k search runs.
+    With `hybrid` on and the question text given, search fuses vector and
+    full-text results (each `hybrid_candidates` deep) by reciprocal rank.
+    """
+
+    hybrid: bool = HYBRID_SEARCH_ENABLED
+    hybrid_candidates: int = HYBRID_CANDIDATES
+    rrf_k: int = HYBRID_RRF_K
+
+    @abstractmethod
+    def vector_search(self, query_embedding: List[float], user_id: str,
+                      knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10) -> List[Document]:
+        """Top-k chunks of a user's knowledge bases (optionally only the given ones), most similar first"""
+
+    def text_search(self, query_text: str, user_id: str,
+                    knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10) -> List[Document]:
+        """Top-k chunks by full-text match of the question; backends without one return nothing"""
+        return []
+
+    def search(self, query_embedding: List[float], user_id: str,
+               knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10,
+               query_text: Optional[str] = None) -> List[Document]:
+        if knowledge_base_ids:
+            knowledge_base_ids = valid_knowledge_base_ids(knowledge_base_ids)
+            if not knowledge_base_ids:
+                return []
+        if not (self.hybrid and query_text):
+            return self.vector_search(query_embedding, user_id, knowledge_base_ids, k)
+        candidates = max(k, self.hybrid_candidates)
+        return reciprocal_rank_fusion([
+            self.vector_search(query_embedding, user_id, knowledge_base_ids, candidates),
+            self.text_search(query_text, user_id, knowledge_base_ids, candidates)
+        ], k, self.rrf_k)
+
+    async def asearch(self, query_embedding: List[float], user_id: str,
+                      knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10,
+                      query_text: Optional[str] = None) -> List[Document]:
+        if knowledge_base_ids:
+            knowledge_base_ids = valid_knowledge_base_ids(knowledge_base_ids)
+            if not knowledge_base_ids:
+                return []
+        if not (self.hybrid and query_text):
+            return await asyncio.to_thread(self.vector_search, query_embedding, user_id, knowledge_base_ids, k)
+        # Both retrievers run concurrently
+        candidates = max(k, self.hybrid_candidates)
+        vector_docs, text_docs = await asyncio.gather(
+            asyncio.to_thread(self.vector_search, query_embedding, user_id, knowledge_base_ids, candidates),
+            asyncio.to_thread(self.text_search, query_text, user_id, knowledge_base_ids, candidates)
+        )
+        return reciprocal_rank_fusion([vector_docs, text_docs], k, self.rrf_k)
+
+    def invalidate(self, knowledge_base_id: str):
+        """Called after a knowledge base's vectors were written or deleted"""
+
+
+class SupabaseChunkStore(ChunkStore):
+    """
+    Retrieval over saas_knowledge_base_vectors through the scoped match RPC.
+    In "exact" mode rows are narrowed by the indexed user_id / knowledge_base_id
+    columns before they are ordered by vector distance; in "ann" mode they are
+    ordered through the embedding index, tuned per query by probes / ef_search,
+    and with "half" precision through the halfvec index followed by a
+    full-precision rerank. Full-text search runs through the content_tsv GIN
+    index (text_query_name).
+    """
+
+    def __init__(self, client=None, query_name: str = SUPABASE_SCOPED_MATCH_FUNC,
+                 mode: str = VECTOR_SEARCH_MODE, probes: int = VECTOR_IVFFLAT_PROBES,
+                 ef_search: int = VECTOR_HNSW_EF_SEARCH, precision: str = VECTOR_SEARCH_PRECISION,
+                 rerank_factor: int = VECTOR_RERANK_FACTOR, text_query_name: str = SUPABASE_TEXT_SEARCH_FUNC):
+        if precision not in INDEX_PRECISIONS:
+            raise ValueError(f"Unknown vector search precision: {precision}")
+        self.client = client or supabase
+        self.query_name = query_name
+        self.text_query_name = text_query_name
+        self.exact = mode != "ann"
+        self.probes = probes
+        self.ef_search = ef_search
+        self.half_precision = precision == "half"
+        self.rerank_factor = rerank_factor
+
+    def vector_search(self, query_embedding: List[float], user_id: str,
+                      knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10) -> List[Document]:
+        params = {
+            "query_embedding": query_embedding,
+            "p_user_id": user_id,
+            "p_knowledge_base_ids": list(knowledge_base_ids) if knowledge_base_ids else None,
+            "match_count": k,
+            "p_exact": self.exact,
+            "p_probes": self.probes,
+            "p_ef_search": self.ef_search,
+            "p_half_precision": self.half_precision,
+            "p_rerank_factor": self.rerank_factor
+        }
+        result = self.client.rpc(self.query_name, params).execute()
+        return [
+            Document(
+                page_content=row["content"],
+                metadata={**(row.get("metadata") or {}), "similarity": row.get("similarity")}
+            )
+            for row in result.data or []
+        ]
+
+    def text_search(self, query_text: str, user_id: str,
+                    knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10) -> List[Document]:
+        params = {
+            "query_text": query_text,
+            "p_user_id": user_id,
+            "p_knowledge_base_ids": list(knowledge_base_ids) if knowledge_base_ids else None,
+            "match_count": k
+        }
+        try:
+            result = self.client.rpc(self.text_query_name, params).execute()
+        except Exception as e:
+            # Vector results alone still answer the question
+            logger.warning(f"Full-text chunk search failed, using vector search only: {e}")
+            return []
+        return [
+            Document(
+                page_content=row["content"],
+                metadata={**(row.get("metadata") or {}), "text_rank": row.get("rank")}
+            )
+            for row in result.data or []
+        ]
+
+
+class SupabaseChunkSource:
+    """Where LocalChunkStore loads knowledge bases from when it has no local copy"""
+
+    PAGE_SIZE = 1000  # PostgREST's default row limit
+
+    def __init__(self, client=None):
+        self.client = client or supabase
+
+    def knowledge_base_ids(self, user_id: str) -> List[str]:
+        # Imported here: entitlements is only needed when a source is configured
+        from backend.app.services.entitlements import get_entitlements
+        return get_entitlements(user_id)["active_knowledge_base_ids"]
+
+    def fetch(self, knowledge_base_id: str) -> Optional[dict]:
+        """All chunks of a knowledge base as {user_id, contents, metadatas, vectors}"""
+        rows = []
+        start = 0
+        while True:
+            result = self.client.table(SUPABASE_VECTOR_TABLE)\
+                .select("user_id, content, metadata, embedding")\
+                .eq("knowledge_base_id", knowledge_base_id)\
+                .order("id")\
+                .range(start, start + self.PAGE_SIZE - 1)\
+                .execute()
+            rows.extend(result.data or [])
+            if len(result.data or []) < self.PAGE_SIZE:
+                break
+            start += self.PAGE_SIZE
+        if not rows:
+            return None
+
+        # pgvector values come back from PostgREST as "[0.1,0.2,...]" strings
+        vectors = [json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
+                   for row in rows]
+        return {
+            "user_id": rows[0]["user_id"] or (rows[0].get("metadata") or {}).get("user_id"),
+            "contents": [row["content"] for row in rows],
+            "metadatas": [row.get("metadata") or {} for row in rows],
+            "vectors": vectors
+        }
+
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# Rows scored per step when the first pass runs on a quantized matrix (bounds temporary memory)
+_SCORE_BLOCK_ROWS = 8192
+
+# Words, numbers and joined codes such as "sku-1042" or "555.123.4567"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercased tokens; joined codes are kept whole and also split into their parts"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(re.split(r"[-./]", token))
+    return tokens
+
+
+class _LoadedKnowledgeBase:
+    """
+    One knowledge base in memory: memory-mapped float32 unit vectors plus chunk texts.
+    With float16 / int8 precision a quantized copy is kept in RAM for the first
+    pass and only the best k * rerank_factor rows are rescored from the
+    full-precision file.
+    """
+
+    def __init__(self, user_id: str, matrix: np.ndarray, contents: List[str], metadatas: List[dict],
+                 ann_min_rows: int, ann_probes: int, precision: str = "float32", rerank_factor: int = 4):
+        self.user_id = user_id
+        self.matrix = matrix
+        self.contents = contents
+        self.metadatas = metadatas
+        self.ann_probes = ann_probes
+        self.precision = precision
+        self.rerank_factor = max(1, rerank_factor)
+        self._centroids = None
+        self._lists = None
+        self._quantized = None
+        self._scale = None
+        self._postings = None
+        self._lengths = None
+        if precision == "float16" and len(matrix):
+            self._quantized = np.asarray(matrix, dtype=np.float16)
+        elif precision == "int8" and len(matrix):
+            # Symmetric per-dimension scalar quantization
+            self._scale = np.maximum(np.abs(matrix).max(axis=0), 1e-12) / 127.0
+            self._quantized = np.round(matrix / self._scale).astype(np.int8)
+        if len(matrix) >= ann_min_rows:
+            self._build_ivf()
+
+    def _build_ivf(self, iterations: int = 5):
+        """Coarse k-means partition used for approximate search on large knowledge bases"""
+        rows = len(self.matrix)
+        n_lists = max(1, int(np.sqrt(rows)))
+        rng = np.random.default_rng(0)
+        centroids = np.array(self.matrix[rng.choice(rows, n_lists, replace=False)])
+        for _ in range(iterations):
+            assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = self.matrix[assignments == i]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[i] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assignments == i) for i in range(n_lists)]
+
+    def _first_pass_scores(self, query: np.ndarray, candidates: Optional[np.ndarray]) -> np.ndarray:
+        if self._quantized is None:
+            return (self.matrix if candidates is None else self.matrix[candidates]) @ query
+        source = self._quantized if candidates is None else self._quantized[candidates]
+        # int8 rows are dequantized through the query: (q * scale) . x == q . (x * scale)
+        weights = query * self._scale if self._scale is not None else query
+        scores = np.empty(len(source), dtype=np.float32)
+        for start in range(0, len(source), _SCORE_BLOCK_ROWS):
+            block = source[start:start + _SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ weights
+        return scores
+
+    @staticmethod
+    def _best(scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=int)
+        best = np.argpartition(-scores, k - 1)[:k]
+        return best[np.argsort(-scores[best])]
+
+    def _build_postings(self):
+        """Inverted index (token -> rows, term counts) used for BM25 text search"""
+        postings = {}
+        lengths = np.zeros(len(self.contents), dtype=np.float32)
+        for row, content in enumerate(self.contents):
+            tokens = _tokenize(content)
+            lengths[row] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((row, count))
+        # Lengths first: a concurrent search only checks _postings
+        self._lengths = lengths
+        self._postings = {token: (np.array([row for row, _ in rows]), np.array([c for _, c in rows], np.float32))
+                          for token, rows in postings.items()}
+
+    def text_top_k(self, query_text: str, k: int, k1: float = 1.2, b: float = 0.75):
+        """(row indices, BM25 scores) of the k best rows containing any token of the query"""
+        if self._postings is None:
+            self._build_postings()
+        rows = len(self.contents)
+        average_length = float(self._lengths.mean()) or 1.0
+        scores = np.zeros(rows, dtype=np.float32)
+        for token in set(_tokenize(query_text)):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            matched, counts = posting
+            idf = math.log(1 + (rows - len(matched) + 0.5) / (len(matched) + 0.5))
+            norm = k1 * (1 - b + b * self._lengths[matched] / average_length)
+            scores[matched] += idf * counts * (k1 + 1) / (counts + norm)
+        best = self._best(scores, k)
+        best = best[scores[best] > 0]
+        return best, scores[best]
+
+    def top_k(self, query: np.ndarray, k: int):
+        """(row indices, similarities) of the k best rows; approximate when an IVF partition exists"""
+        candidates = None
+        if self._centroids is not None:
+            nearest = np.argsort(-(self._centroids @ query))[:self.ann_probes]
+            candidates = np.concatenate([self._lists[i] for i in nearest])
+
+        scores = self._first_pass_scores(query, candidates)
+        if self._quantized is None:
+            best = self._best(scores, k)
+            rows = candidates[best] if candidates is not None else best
+            return rows, scores[best]
+
+        # Rescore the best quantized matches at full precision
+        best = self._best(scores, k * self.rerank_factor)
+        shortlist = np.sort(candidates[best] if candidates is not None else best)  # sequential reads
+        exact = self.matrix[shortlist] @ query
+        best = self._best(exact, k)
+        return shortlist[best], exact[best]
+
+
+class LocalChunkStore(ChunkStore):
+    """
+    In-process retrieval over per-knowledge-base NumPy files.
+    Each knowledge base is kept under `path/<id>/` as a float32 matrix of unit
+    vectors (vectors.f32, memory-mapped), its chunk texts (chunks.json) and a
+    small manifest (meta.json).
+    `precision` float16 / int8 keeps only a quantized copy resident for the
+    first pass, with a full-precision rerank of the top k * rerank_factor.
+    This saves memory, not time: quantized blocks are converted to float32 to
+    be scored, so exact scans run about 3x (int8) to 10x (float16) slower.
+    Text search uses BM25 over an inverted index built on first use.
+    Knowledge bases are loaded on first use and the `warm` most recently used
+    stay in memory. With a `source`, missing knowledge bases are copied from
+    Supabase; without one the store is fully offline (fill it with
+    write_knowledge_base).
+    """
+
+    def __init__(self, path: str, source: Optional[SupabaseChunkSource] = None,
+                 warm: int = 64, ann_min_rows: int = 50000, ann_probes: int = 16,
+                 precision: str = "float32", rerank_factor: int = 4):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown vector precision: {precision}")
+        self.path = path
+        self.source = source
+        self.warm = warm
+        self.ann_min_rows = ann_min_rows
+        self.ann_probes = ann_probes
+        self.precision = precision
+        self.rerank_factor = rerank_factor
+        self._loaded: "OrderedDict[str, _LoadedKnowledgeBase]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, knowledge_base_id: str) -> str:
+        return os.path.join(self.path, knowledge_base_id)
+
+    def write_knowledge_base(self, knowledge_base_id: str, user_id: str, contents: List[str],
+                             metadatas: List[dict], vectors: List[List[float]]):
+        """Replace the local copy of a knowledge base"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        # Write next to the old copy and swap, so readers never see a partial file
+        target = self._dir(knowledge_base_id)
+        staging = target + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        matrix.tofile(os.path.join(staging, "vectors.f32"))
+        with open(os.path.join(staging, "chunks.json"), "w") as f:
+            json.dump({"contents": contents, "metadatas": metadatas}, f)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({
+                "user_id": user_id,
+                "rows": len(contents),
+                "dimensions": int(matrix.shape[1]) if matrix.ndim == 2 else 0
+            }, f)
+        with self._lock:
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(staging, target)
+            self._loaded.pop(knowledge_base_id, None)
+
+    def _read_meta(self, knowledge_base_id: str) -> Optional[dict]:
+        meta_path = os.path.join(self._dir(knowledge_base_id), "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _read(self, knowledge_base_id: str) -> Optional[_LoadedKnowledgeBase]:
+        meta = self._read_meta(knowledge_base_id)
+        if meta is None:
+            return None
+        directory = self._dir(knowledge_base_id)
+        with open(os.path.join(directory, "chunks.json")) as f:
+            chunks = json.load(f)
+        matrix = np.memmap(os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r",
+                           shape=(meta["rows"], meta["dimensions"])) if meta["rows"] else np.zeros((0, 0), np.float32)
+        return _LoadedKnowledgeBase(meta["user_id"], matrix, chunks["contents"], chunks["metadatas"],
+                                    self.ann_min_rows, self.ann_probes, self.precision, self.rerank_factor)
+
+    def _get(self, knowledge_base_id: str) -> Optional[_LoadedKnowledgeBase]:
+        with self._lock:
+            loaded = self._loaded.get(knowledge_base_id)
+            if loaded is not None:
+                self._loaded.move_to_end(knowledge_base_id)
+                return loaded
+
+        loaded = self._read(knowledge_base_id)
+        if loaded is None and self.source is not None:
+            fetched = self.source.fetch(knowledge_base_id)
+            if fetched:
+                logger.info(f"Copying {len(fetched['contents'])} vectors of knowledge base {knowledge_base_id} locally")
+                self.write_knowledge_base(knowledge_base_id, **fetched)
+                loaded = self._read(knowledge_base_id)
+        if loaded is None:
+            return None
+
+        with self._lock:
+            self._loaded[knowledge_base_id] = loaded
+            self._loaded.move_to_end(knowledge_base_id)
+            while len(self._loaded) > self.warm:
+                self._loaded.popitem(last=False)
+        return loaded
+
+    def _local_knowledge_base_ids(self, user_id: str) -> List[str]:
+        ids = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                continue
+            meta = self._read_meta(name)
+            if meta is not None and meta["user_id"] == user_id:
+                ids.append(name)
+        return ids
+
+    def _scope(self, user_id: str, knowledge_base_ids: Optional[Sequence[str]]) -> List[_LoadedKnowledgeBase]:
+        # Narrow the request to the user's own knowledge bases before anything is loaded or fetched
+        requested = valid_knowledge_base_ids(knowledge_base_ids) if knowledge_base_ids else None
+        if self.source is not None:
+            owned = self.source.knowledge_base_ids(user_id)
+            knowledge_base_ids = owned if requested is None else [kb_id for kb_id in requested if kb_id in owned]
+        elif requested is None:
+            knowledge_base_ids = self._local_knowledge_base_ids(user_id)
+        else:
+            knowledge_base_ids = [kb_id for kb_id in requested
+                                  if (self._read_meta(kb_id) or {}).get("user_id") == user_id]
+        scope = []
+        for knowledge_base_id in knowledge_base_ids:
+            loaded = self._get(knowledge_base_id)
+            # Never serve another user's knowledge base
+            if loaded is not None and loaded.user_id == user_id and len(loaded.contents):
+                scope.append(loaded)
+        return scope
+
+    @staticmethod
+    def _documents(hits: list, k: int, score_key: str) -> List[Document]:
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return [
+            Document(page_content=loaded.contents[row], metadata={**loaded.metadatas[row], score_key: score})
+            for score, loaded, row in hits[:k]
+        ]
+
+    def vector_search(self, query_embedding: List[float], user_id: str,
+                      knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10) -> List[Document]:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        hits = []
+        for loaded in self._scope(user_id, knowledge_base_ids):
+            rows, scores = loaded.top_k(query, k)
+            hits.extend((float(score), loaded, int(row)) for row, score in zip(rows, scores))
+        return self._documents(hits, k, "similarity")
+
+    def text_search(self, query_text: str, user_id: str,
+                    knowledge_base_ids: Optional[Sequence[str]] = None, k: int = 10) -> List[Document]:
+        hits = []
+        for loaded in self._scope(user_id, knowledge_base_ids):
+            rows, scores = loaded.text_top_k(query_text, k)
+            hits.extend((float(score), loaded, int(row)) for row, score in zip(rows, scores))
+        return self._documents(hits, k, "text_rank")
+
+    def invalidate(self, knowledge_base_id: str):
+        """Forget the loaded copy; with a source the files are dropped too and copied again on next use"""
+        with self._lock:
+            self._loaded.pop(knowledge_base_id, None)
+            if self.source is not None:
+                shutil.rmtree(self._dir(knowledge_base_id), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"warm": len(self._loaded), "stored": len([n for n in os.listdir(self.path)
+                                                              if not n.endswith(".tmp")])}
+
+
+def _warn_on_precision_mismatch(search_precision: str):
+    try:
+        mismatch = search_precision_mismatch(get_index_stats(), search_precision)
+    except Exception as e:
+        logger.debug(f"Could not compare search precision with the embedding index: {e}")
+        return
+    if mismatch:
+        logger.warning(mismatch)
+
+
+_chunk_store: Optional[ChunkStore] = None
+_chunk_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    """The configured retrieval backend (VECTOR_STORE_BACKEND), created on first use"""
+    global _chunk_store
+    if _chunk_store is None:
+        with _chunk_store_lock:
+            if _chunk_store is None:
+                if VECTOR_STORE_BACKEND == "local":
+                    _chunk_store = LocalChunkStore(
+                        LOCAL_VECTOR_STORE_PATH,
+                        source=SupabaseChunkSource(),
+                        warm=LOCAL_VECTOR_STORE_WARM_KBS,
+                        ann_min_rows=LOCAL_VECTOR_ANN_MIN_ROWS,
+                        ann_probes=LOCAL_VECTOR_ANN_PROBES,
+                        precision=LOCAL_VECTOR_PRECISION,
+                        rerank_factor=VECTOR_RERANK_FACTOR
+                    )
+                else:
+                    _chunk_store = SupabaseChunkStore()
+                    _warn_on_precision_mismatch(VECTOR_SEARCH_PRECISION)
+    return _chunk_store
+
+
+def invalidate_knowledge_base_vectors(knowledge_base_id: str):
+    """Hook for ingestion and deletes: local copies of the knowledge base are stale"""
+    if _chunk_store is not None:
+        _chunk_store.invalidate(knowledge_base_id)
@@ -13,8 +13,151 @@ SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 # Updated table names with saas_ prefix
 SUPABASE_VECTOR_TABLE = "saas_knowledge_base_vectors"
 SUPABASE_MATCH_FUNC = "match_saas_knowledge_base_vectors"
+SUPABASE_SCOPED_MATCH_FUNC = "match_saas_knowledge_base_chunks"  # filters on user / knowledge base columns
+SUPABASE_TEXT_SEARCH_FUNC = "search_saas_knowledge_base_chunks_text"  # full-text side of hybrid retrieval
 
 # JWT Settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Embed stable user claims (id, name) in access tokens so authenticated requests skip the user lookup
+TOKEN_USER_CLAIMS = os.getenv("TOKEN_USER_CLAIMS", "true").lower() == "true"
+
+# Password Hashing Settings
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # work factor; existing hashes are upgraded on login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # threads for bcrypt hash/verify
+
+# Authenticated User Cache Settings (0 disables)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Indexing Settings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# Reduced output size (text-embedding-3-* only); must match the vector column size in database_setup.sql
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))  # chunks per embed_documents call
+VECTOR_INSERT_BATCH_SIZE = int(os.getenv("VECTOR_INSERT_BATCH_SIZE", "200"))  # rows per multi-row insert
+INDEX_BATCH_MAX_RETRIES = int(os.getenv("INDEX_BATCH_MAX_RETRIES", "3"))  # retries after a failed batch
+INDEX_BATCH_RETRY_BACKOFF_SECONDS = float(os.getenv("INDEX_BATCH_RETRY_BACKOFF_SECONDS", "1.0"))
+# Duplicate and near-duplicate chunks within a document or page (SimHash within this many bits) are not
+# embedded or stored; lines repeated across a site's pages are stored once, on its #site-wide page
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", "7"))  # ~a few edited words per 1000-char chunk
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))  # lines on this many pages are stored once, 0 = off
+
+# Embedding Cache Settings
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent.parent / ".cache" / "embeddings.sqlite3")
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))  # ~6KB per 1536-dim vector
+
+# Ingestion Job Settings
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))  # knowledge bases processed concurrently
+# Running jobs renew a lease every third of this; jobs whose lease expired (crashed process) are re-queued
+INGEST_JOB_LEASE_SECONDS = float(os.getenv("INGEST_JOB_LEASE_SECONDS", "120"))
+INGEST_QUEUE_PATH = os.getenv(
+    "INGEST_QUEUE_PATH",
+    str(Path(__file__).resolve().parent.parent.parent / ".cache" / "ingestion_jobs.sqlite3")
+)
+INGEST_UPLOAD_DIR = os.getenv(
+    "INGEST_UPLOAD_DIR",
+    str(Path(__file__).resolve().parent.parent.parent / ".cache" / "uploads")
+)
+MAX_UPLOAD_SIZE_MB = float(os.getenv("MAX_UPLOAD_SIZE_MB", "50"))  # larger document uploads get a 413
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # bytes copied per read while saving
+# Website pages flow crawl -> chunk -> embed -> write; each stage holds at most this many pages in its queue
+INGEST_PIPELINE_QUEUE_SIZE = int(os.getenv("INGEST_PIPELINE_QUEUE_SIZE", "4"))
+# After a crawl with fetch errors, pages it did not reach are only removed if it reached this share of the stored pages
+SYNC_REMOVE_MIN_COVERAGE = float(os.getenv("SYNC_REMOVE_MIN_COVERAGE", "0.8"))
+
+# Website Crawl Settings (crawler.py)
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "20"))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "3"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "6"))  # pages fetched at once per crawl
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "2"))
+CRAWL_RESPECT_ROBOTS = os.getenv("CRAWL_RESPECT_ROBOTS", "true").lower() == "true"
+CRAWL_USE_SITEMAP = os.getenv("CRAWL_USE_SITEMAP", "true").lower() == "true"  # seed from sitemap.xml
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "ChatbotSaaSBot/1.0")
+CRAWL_PAGE_TIMEOUT_SECONDS = float(os.getenv("CRAWL_PAGE_TIMEOUT_SECONDS", "30"))
+CRAWL_MAX_DELAY_SECONDS = float(os.getenv("CRAWL_MAX_DELAY_SECONDS", "10"))  # cap on robots.txt Crawl-delay
+# Pages are fetched over plain HTTP first; the headless browser only renders those that need JavaScript
+CRAWL_HTTP_FIRST = os.getenv("CRAWL_HTTP_FIRST", "true").lower() == "true"
+CRAWL_JS_MIN_TEXT_CHARS = int(os.getenv("CRAWL_JS_MIN_TEXT_CHARS", "250"))  # less text than this -> render
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))  # long-lived browsers per process
+BROWSER_PAGES_PER_BROWSER = int(os.getenv("BROWSER_PAGES_PER_BROWSER", "4"))
+
+# Chat Settings
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+CHAT_TEMPERATURE = float(os.getenv("CHAT_TEMPERATURE", "0"))
+CHAT_RETRIEVAL_K = int(os.getenv("CHAT_RETRIEVAL_K", "6"))
+# Context packing (context_builder.py): token budget of the retrieved context in the prompt,
+# and the cosine similarity below which chunks are left out (model dependent; 0 disables)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MIN_SIMILARITY = float(os.getenv("CONTEXT_MIN_SIMILARITY", "0.7"))
+
+# Conversation Memory Settings (conversation.py): recent turns kept verbatim within a token budget,
+# older turns summarised and follow-ups condensed into standalone questions by HISTORY_MODEL
+HISTORY_MODEL = os.getenv("HISTORY_MODEL", "gpt-4o-mini")
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "200"))  # max length of the running summary
+HISTORY_CACHE_TTL_SECONDS = int(os.getenv("HISTORY_CACHE_TTL_SECONDS", "1800"))
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "10000"))
+# chat_history comes from the client: only the most recent turns / characters of it are used
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "40"))
+HISTORY_MAX_CHARS = int(os.getenv("HISTORY_MAX_CHARS", "24000"))
+
+# Answer Cache Settings (semantic cache of previous answers per user)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine similarity needed for a hit
+# The cache is per process: a knowledge base change only invalidates it in the worker that handled it,
+# so with several uvicorn workers other workers may serve stale answers for up to this long
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "200"))  # per user / knowledge base scope
+ANSWER_CACHE_MAX_SCOPES = int(os.getenv("ANSWER_CACHE_MAX_SCOPES", "1000"))
+
+# Query Embedding Cache Settings (chat questions; 0 disables)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1000"))
+# Also persist query embeddings in the shared embedding cache file
+QUERY_EMBEDDING_CACHE_SHARED = os.getenv("QUERY_EMBEDDING_CACHE_SHARED", "false").lower() == "true"
+
+# Entitlement Cache Settings (subscription / knowledge base gating of the public widget; 0 disables)
+ENTITLEMENT_CACHE_TTL_SECONDS = int(os.getenv("ENTITLEMENT_CACHE_TTL_SECONDS", "30"))
+ENTITLEMENT_CACHE_MAX_ENTRIES = int(os.getenv("ENTITLEMENT_CACHE_MAX_ENTRIES", "10000"))
+
+# Vector Search Settings
+# "exact": prefilter the tenant's rows, then order by distance; "ann": order through the embedding index
+VECTOR_SEARCH_MODE = os.getenv("VECTOR_SEARCH_MODE", "exact").lower()
+VECTOR_IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", "10"))  # ann mode, ivfflat index
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "40"))  # ann mode, hnsw index
+# "full" or "half": ann mode searches the halfvec index, then reranks at full precision.
+# Must match the precision the index was built with (VECTOR_INDEX_PRECISION), or searches fall back to a scan
+VECTOR_SEARCH_PRECISION = os.getenv("VECTOR_SEARCH_PRECISION", "full").lower()
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))  # candidates reranked = k * factor
+
+# Hybrid Retrieval Settings (full-text search fused with vector search by reciprocal rank)
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # taken from each retriever before fusion
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))  # rank constant; higher flattens the rank weights
+
+# Retrieval backend: "supabase" (match RPC) or "local" (per-knowledge-base NumPy copies, see vector_store.py)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "supabase").lower()
+LOCAL_VECTOR_STORE_PATH = os.getenv(
+    "LOCAL_VECTOR_STORE_PATH",
+    str(Path(__file__).resolve().parent.parent.parent / ".cache" / "vectors")
+)
+LOCAL_VECTOR_STORE_WARM_KBS = int(os.getenv("LOCAL_VECTOR_STORE_WARM_KBS", "64"))  # knowledge bases kept loaded
+LOCAL_VECTOR_ANN_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_ANN_MIN_ROWS", "50000"))  # approximate search from this size
+LOCAL_VECTOR_ANN_PROBES = int(os.getenv("LOCAL_VECTOR_ANN_PROBES", "16"))
+# Resident vector precision of the local backend: "float32", "float16" or "int8" (quantized + rerank).
+# Quantized copies trade CPU for memory on exact scans: about 3x (int8) and 10x (float16) slower than float32
+LOCAL_VECTOR_PRECISION = os.getenv("LOCAL_VECTOR_PRECISION", "float32").lower()
+
+# Vector Index Maintenance Settings (python -m backend.maintain_vector_index)
+VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "ivfflat").lower()  # "ivfflat" or "hnsw"
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+VECTOR_INDEX_PRECISION = os.getenv("VECTOR_INDEX_PRECISION", "full").lower()  # "full" or "half" (halfvec index)
+# Rebuild once the table has grown by this factor since the last build
+VECTOR_INDEX_REBUILD_GROWTH = float(os.getenv("VECTOR_INDEX_REBUILD_GROWTH", "2.0"))
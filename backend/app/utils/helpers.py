@@ -1,6 +1,42 @@
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+# Query parameters that only track the visit and never change the page
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "_ga"}
+TRACKING_PARAM_PREFIXES = ("utm_",)
+
 def normalize_site_url(url: str) -> str:
     return url.replace("https://", "").replace("http://", "").rstrip("/")
 
+def site_host(url: str) -> str:
+    """Host of a URL without a leading www., used to tell internal links from external ones"""
+    host = urlsplit(url if "://" in url else f"https://{url}").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """
+    Canonical form of a page URL for deduplication: resolved against `base`,
+    lowercase scheme and host, no default port, fragment or tracking parameters,
+    sorted query and no trailing slash (normalize_site_url's convention).
+    Returns None for anything that is not an http(s) page.
+    """
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    elif "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES))
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
 def get_file_extension(filename: str) -> str:
     """Get file extension from filename"""
     return filename.split('.')[-1].lower() if '.' in filename else ''
@@ -0,0 +1,157 @@
+"""
+Concurrent chat throughput benchmark with stubbed OpenAI and Supabase backends.
+
+Compares the old blocking path (sync get_chat_response called from an async
+handler, as /chat/ask used to do) with the async path, on a single event loop
+the way one uvicorn worker serves requests. No network access is needed.
+
+Run from the repository root:
+    python -m backend.benchmark_chat_concurrency --requests 50 --latency 0.2
+"""
+import os
+
+# Dummy settings so the app modules import without real credentials
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "stub.stub.stub")
+os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.app.services import chat_agent
+from backend.app.utils.config import CHAT_MODEL, CHAT_TEMPERATURE
+
+
+class StubEmbeddings(Embeddings):
+    """Embeddings that only simulate OpenAI round-trip latency"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [[0.0] * 8 for _ in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return [0.0] * 8
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return [0.0] * 8
+
+
+class StubChunkStore:
+    """Stands in for the Supabase match RPC (a blocking HTTP call)"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.docs = [Document(page_content=f"Stub context chunk {i}", metadata={"source_url": "https://example.com"})
+                     for i in range(4)]
+
+    def search(self, query_embedding, user_id: str, knowledge_base_ids=None, k: int = 10, query_text=None):
+        time.sleep(self.latency)
+        return self.docs[:k]
+
+    async def asearch(self, query_embedding, user_id: str, knowledge_base_ids=None, k: int = 10, query_text=None):
+        # Same as SupabaseChunkStore: the sync client runs in a thread
+        return await asyncio.to_thread(self.search, query_embedding, user_id, knowledge_base_ids, k)
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that sleeps instead of calling gpt-4o"""
+
+    latency: float = 1.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Stub answer"))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Stub answer"))])
+
+
+def install_stubs(latency: float):
+    """Swap the shared chat engine and history writer for latency-only stubs"""
+    chat_agent._engines[(CHAT_MODEL, CHAT_TEMPERATURE)] = chat_agent.ChatEngine(
+        embedding=StubEmbeddings(latency),
+        llm=StubChatModel(latency=latency * 5),  # completions are the slowest call
+        store=StubChunkStore(latency),
+        answer_cache=None,  # every request should take the full pipeline
+        query_cache=None
+    )
+
+    def save_chat_history(*args, **kwargs):
+        time.sleep(latency)
+
+    async def asave_chat_history(*args, **kwargs):
+        await asyncio.to_thread(save_chat_history)
+
+    chat_agent.save_chat_history = save_chat_history
+    chat_agent.asave_chat_history = asave_chat_history
+
+
+async def blocking_handler(index: int) -> str:
+    # The pre-async request handler: async def, but a synchronous pipeline inside
+    return chat_agent.get_chat_response(f"user-{index}", "What are your opening hours?", [])
+
+
+async def async_handler(index: int) -> str:
+    return await chat_agent.aget_chat_response(f"user-{index}", "What are your opening hours?", [])
+
+
+async def run_scenario(handler, requests: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+
+    async def timed(index: int):
+        # Latency as the client sees it: all requests arrive together at `start`
+        await handler(index)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(timed(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "throughput": requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="concurrent chat requests per scenario")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="simulated latency (s) of embedding/RPC/history calls; the LLM takes 5x this")
+    args = parser.parse_args()
+
+    install_stubs(args.latency)
+
+    print(f"{args.requests} concurrent requests, stub latency {args.latency:.2f}s "
+          f"(one request ≈ {args.latency * 8:.2f}s of backend time)")
+    print(f"{'pipeline':<12}{'total (s)':>12}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}")
+    for name, handler in (("blocking", blocking_handler), ("async", async_handler)):
+        result = asyncio.run(run_scenario(handler, args.requests))
+        print(f"{name:<12}{result['elapsed']:>12.2f}{result['throughput']:>10.2f}"
+              f"{result['p50']:>10.2f}{result['p95']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Login burst benchmark with a stubbed Supabase user table.
+
+Runs a burst of concurrent logins next to a "chat" coroutine that ticks every
+10ms, on one event loop the way a uvicorn worker serves them. Compares
+verifying passwords inline (the old behaviour) with authenticate_user, which
+runs bcrypt on the dedicated password pool. The tick lag shows how long other
+requests on the same worker were stalled.
+
+Run from the repository root:
+    python -m backend.benchmark_login --logins 20 --rounds 12
+"""
+import os
+
+# Dummy settings so the app modules import without real credentials
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "stub.stub.stub")
+os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+
+import argparse
+import asyncio
+import statistics
+import time
+
+
+# Imported in main(), after BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS are set from the arguments
+auth_service = None
+
+PASSWORD = "correct horse battery staple"
+
+
+class StubQuery:
+    """Just enough of the PostgREST query builder for authenticate_user"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def update(self, *args, **kwargs):
+        return self
+
+    def eq(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        return self
+
+    @property
+    def data(self):
+        return self.rows
+
+
+class StubSupabase:
+    def __init__(self, user: dict):
+        self.user = user
+
+    def table(self, name: str):
+        return StubQuery([dict(self.user)])
+
+
+def install_stubs():
+    user = {
+        "id": "00000000-0000-0000-0000-000000000001",
+        "email": "bench@example.com",
+        "full_name": "Bench User",
+        "password_hash": auth_service.get_password_hash(PASSWORD),
+        "created_at": "2024-01-01T00:00:00"
+    }
+    auth_service.supabase = StubSupabase(user)
+    return user
+
+
+async def blocking_login(user: dict) -> bool:
+    # The pre-offload handler: bcrypt verified inline on the event loop
+    return auth_service.verify_password(PASSWORD, user["password_hash"])
+
+
+async def offloaded_login(user: dict) -> bool:
+    return await auth_service.authenticate_user(user["email"], PASSWORD) is not None
+
+
+async def run_scenario(login, user: dict, logins: int) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def chat_ticker():
+        # Stands in for chat requests sharing the worker
+        while not done.is_set():
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    ticker = asyncio.create_task(chat_ticker())
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(user) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker
+
+    assert all(results), "a login failed"
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "throughput": logins / elapsed,
+        "lag_p50": statistics.median(lags) if lags else 0.0,
+        "lag_max": lags[-1] if lags else 0.0
+    }
+
+
+def main():
+    global auth_service
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=20, help="concurrent logins per scenario")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor (BCRYPT_ROUNDS)")
+    parser.add_argument("--workers", type=int, default=2, help="password pool size (PASSWORD_HASH_WORKERS)")
+    args = parser.parse_args()
+
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    from backend.app.services import auth_service
+
+    user = install_stubs()
+
+    print(f"{args.logins} concurrent logins, bcrypt rounds {args.rounds}, password pool {args.workers}")
+    print(f"{'pipeline':<12}{'total (s)':>12}{'logins/s':>10}{'lag p50 (ms)':>14}{'lag max (ms)':>14}")
+    for name, login in (("blocking", blocking_login), ("offloaded", offloaded_login)):
+        result = asyncio.run(run_scenario(login, user, args.logins))
+        print(f"{name:<12}{result['elapsed']:>12.2f}{result['throughput']:>10.2f}"
+              f"{result['lag_p50'] * 1000:>14.1f}{result['lag_max'] * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
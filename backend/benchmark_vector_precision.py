@@ -0,0 +1,106 @@
+"""
+Vector precision benchmark for the local chunk store.
+
+Builds a fixture corpus of clustered synthetic embeddings (fixed seed) and
+compares LocalChunkStore at float32, float16 and int8 precision, with the
+exact scan and with the IVF partition. Recall@k is measured against an exact
+float32 scan; "first pass (MB)" is the matrix scanned for every query (the
+quantized copy kept in RAM, or the float32 file itself).
+
+Run from the repository root:
+    python -m backend.benchmark_vector_precision --rows 50000 --queries 200
+"""
+import os
+
+# Dummy settings so the app modules import without real credentials
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "stub.stub.stub")
+os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from backend.app.services.vector_store import PRECISIONS, LocalChunkStore
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+KNOWLEDGE_BASE_ID = "00000000-0000-0000-0000-0000000000b1"  # must be a UUID, like real ids
+
+
+def fixture_corpus(rows: int, dimensions: int, queries: int, seed: int = 7):
+    """Unit vectors scattered around topic centres, like chunks of a few hundred pages"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(1, rows // 200), dimensions)).astype(np.float32)
+    vectors = topics[rng.integers(0, len(topics), rows)] + 0.35 * rng.standard_normal((rows, dimensions),
+                                                                                          dtype=np.float32)
+    probes = topics[rng.integers(0, len(topics), queries)] + 0.35 * rng.standard_normal((queries, dimensions),
+                                                                                           dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return vectors, probes
+
+
+def run_scenario(path: str, precision: str, ann: bool, probes: np.ndarray, truth: list, k: int,
+                 rerank_factor: int) -> dict:
+    store = LocalChunkStore(path, warm=1, ann_min_rows=1 if ann else 10 ** 12,
+                            precision=precision, rerank_factor=rerank_factor)
+    loaded = store._get(KNOWLEDGE_BASE_ID)
+    first_pass = loaded._quantized if loaded._quantized is not None else loaded.matrix
+
+    latencies = []
+    recalls = []
+    for query, expected in zip(probes, truth):
+        start = time.perf_counter()
+        docs = store.search(query.tolist(), USER_ID, [KNOWLEDGE_BASE_ID], k=k)
+        latencies.append(time.perf_counter() - start)
+        found = {doc.metadata["row"] for doc in docs}
+        recalls.append(len(found & expected) / len(expected))
+
+    latencies.sort()
+    return {
+        "recall": statistics.mean(recalls),
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        "megabytes": first_pass.nbytes / 1024 / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="chunks in the fixture knowledge base")
+    parser.add_argument("--dimensions", type=int, default=1536, help="embedding dimensions")
+    parser.add_argument("--queries", type=int, default=200, help="queries per scenario")
+    parser.add_argument("--k", type=int, default=10, help="chunks retrieved per query")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="VECTOR_RERANK_FACTOR")
+    args = parser.parse_args()
+
+    vectors, probes = fixture_corpus(args.rows, args.dimensions, args.queries)
+    truth = [set(np.argsort(-(vectors @ query))[:args.k].tolist()) for query in probes]
+
+    with tempfile.TemporaryDirectory() as path:
+        LocalChunkStore(path).write_knowledge_base(
+            KNOWLEDGE_BASE_ID, USER_ID,
+            [f"chunk {i}" for i in range(args.rows)],
+            [{"row": i} for i in range(args.rows)],
+            vectors
+        )
+
+        print(f"{args.rows} x {args.dimensions} vectors, {args.queries} queries, k={args.k}, "
+              f"rerank factor {args.rerank_factor}")
+        print(f"{'precision':<10}{'search':<8}{'recall@' + str(args.k):>10}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+              f"{'first pass (MB)':>17}")
+        for precision in PRECISIONS:
+            for ann in (False, True):
+                result = run_scenario(path, precision, ann, probes, truth, args.k, args.rerank_factor)
+                if result["recall"] == 0:
+                    raise SystemExit(f"{precision} {'ivf' if ann else 'exact'} search found nothing - "
+                                     f"the fixture knowledge base was not searched")
+                print(f"{precision:<10}{'ivf' if ann else 'exact':<8}{result['recall']:>10.3f}"
+                      f"{result['p50'] * 1000:>10.2f}{result['p95'] * 1000:>10.2f}{result['megabytes']:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
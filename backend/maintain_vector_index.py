@@ -0,0 +1,64 @@
+"""
+Embedding index maintenance for saas_knowledge_base_vectors.
+
+Rebuilds the index when it is missing, when VECTOR_INDEX_METHOD or
+VECTOR_INDEX_PRECISION changed, or when the table has grown by
+VECTOR_INDEX_REBUILD_GROWTH since the last build (ivfflat list counts are
+derived from the row count). Meant to be run from
+cron or by hand; writes to the table wait while the index builds.
+SUPABASE_KEY must be the service role key: the index functions are not
+executable with the anon or authenticated keys.
+
+Run from the repository root:
+    python -m backend.maintain_vector_index            # rebuild only if needed
+    python -m backend.maintain_vector_index --dry-run  # report only
+    python -m backend.maintain_vector_index --force --method hnsw
+    python -m backend.maintain_vector_index --precision half  # halfvec index
+"""
+import argparse
+
+from backend.app.services.vector_index import (
+    INDEX_METHODS, INDEX_PRECISIONS, get_index_stats, ivfflat_lists, ivfflat_probes, rebuild_index, rebuild_reason
+)
+from backend.app.utils.config import VECTOR_INDEX_METHOD, VECTOR_INDEX_PRECISION, VECTOR_SEARCH_PRECISION
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--method", choices=INDEX_METHODS, default=VECTOR_INDEX_METHOD)
+    parser.add_argument("--precision", choices=INDEX_PRECISIONS, default=VECTOR_INDEX_PRECISION,
+                        help="'half' indexes halfvec copies of the embeddings (half the index size)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the index looks adequate")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be done")
+    args = parser.parse_args()
+
+    stats = get_index_stats()
+    row_count = stats.get("row_count") or 0
+    print(f"Rows: {row_count}")
+    print(f"Index: {stats.get('index_definition') or 'missing'}")
+    print(f"Last build: {stats.get('last_build') or 'not recorded'}")
+
+    if args.precision != VECTOR_SEARCH_PRECISION:
+        print(f"Warning: building a {args.precision} index while VECTOR_SEARCH_PRECISION is "
+              f"{VECTOR_SEARCH_PRECISION}; searches would not use it")
+
+    reason = "forced" if args.force else rebuild_reason(stats, args.method, args.precision)
+    if not reason:
+        print("Index is up to date")
+        return
+
+    print(f"Rebuild needed: {reason}")
+    if args.method == "ivfflat":
+        lists = ivfflat_lists(row_count)
+        print(f"Target: ivfflat with {lists} lists (suggested VECTOR_IVFFLAT_PROBES={ivfflat_probes(lists)})")
+    else:
+        print("Target: hnsw")
+    print(f"Precision: {args.precision}")
+    if args.dry_run:
+        return
+
+    print(f"Rebuilt: {rebuild_index(args.method, row_count, args.precision)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -78,18 +78,49 @@ CREATE EXTENSION IF NOT EXISTS vector;
 CREATE TABLE IF NOT EXISTS saas_knowledge_base_vectors (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     knowledge_base_id UUID REFERENCES saas_knowledge_base(id) ON DELETE CASCADE,
+    user_id UUID REFERENCES saas_users(id) ON DELETE CASCADE,
     content TEXT NOT NULL,
     embedding vector(1536),
     metadata JSONB DEFAULT '{}',
     created_at TIMESTAMP DEFAULT NOW()
 );
 
--- Create index on embeddings for faster similarity search
+-- Existing installations: add the user_id column and fill it from the owning knowledge base
+ALTER TABLE saas_knowledge_base_vectors ADD COLUMN IF NOT EXISTS
+    user_id UUID REFERENCES saas_users(id) ON DELETE CASCADE;
+UPDATE saas_knowledge_base_vectors v
+SET user_id = kb.user_id
+FROM saas_knowledge_base kb
+WHERE kb.id = v.knowledge_base_id
+  AND v.user_id IS NULL;
+
+-- Full-text search vector of each chunk, for exact names, product codes and
+-- phone numbers that embeddings miss (hybrid retrieval, see search_saas_knowledge_base_chunks_text)
+ALTER TABLE saas_knowledge_base_vectors ADD COLUMN IF NOT EXISTS
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+
+-- Create index on embeddings for faster similarity search.
+-- Initial ivfflat index; switch to HNSW or re-tune the list count as the table
+-- grows with: python -m backend.maintain_vector_index
 CREATE INDEX IF NOT EXISTS saas_knowledge_base_vectors_embedding_idx 
 ON saas_knowledge_base_vectors 
 USING ivfflat (embedding vector_cosine_ops)
 WITH (lists = 100);
 
+-- Per-page crawl state for URL knowledge bases (used for incremental refresh)
+CREATE TABLE IF NOT EXISTS saas_knowledge_base_pages (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    knowledge_base_id UUID REFERENCES saas_knowledge_base(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    last_crawled_at TIMESTAMP DEFAULT NOW(),
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (knowledge_base_id, url)
+);
+
 -- Create chat history table
 CREATE TABLE IF NOT EXISTS saas_chat_history (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -131,6 +162,297 @@ begin
 end;
 $$;
 
+-- Scoped match function used by the chat retriever.
+-- Exact mode (default): candidate rows are narrowed through the user_id /
+-- knowledge_base_id btree indexes first and only those are ordered by
+-- distance, instead of walking a shared ANN index and discarding other
+-- tenants' rows with a JSONB filter.
+-- ANN mode (p_exact = false): ordered through the embedding index, for tenants
+-- too large for an exact scan; p_probes / p_ef_search tune recall for this query.
+-- With p_half_precision the halfvec index (rebuild_saas_vector_index with
+-- p_precision = 'half') picks match_count * p_rerank_factor candidates, which
+-- are then reranked with the full-precision vectors.
+DROP FUNCTION IF EXISTS match_saas_knowledge_base_chunks(vector, UUID, UUID[], int);
+DROP FUNCTION IF EXISTS match_saas_knowledge_base_chunks(vector, UUID, UUID[], int, BOOLEAN, int, int);
+CREATE OR REPLACE FUNCTION match_saas_knowledge_base_chunks(
+    query_embedding vector(1536),
+    p_user_id UUID,
+    p_knowledge_base_ids UUID[] DEFAULT NULL,
+    match_count int DEFAULT 10,
+    p_exact BOOLEAN DEFAULT TRUE,
+    p_probes int DEFAULT NULL,
+    p_ef_search int DEFAULT NULL,
+    p_half_precision BOOLEAN DEFAULT FALSE,
+    p_rerank_factor int DEFAULT 4
+)
+RETURNS TABLE (
+    id UUID,
+    knowledge_base_id UUID,
+    content TEXT,
+    metadata JSONB,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+begin
+    if p_exact then
+        return query
+        with candidates as materialized (
+            select v.id, v.knowledge_base_id, v.content, v.metadata, v.embedding
+            from saas_knowledge_base_vectors v
+            where v.user_id = p_user_id
+              and (p_knowledge_base_ids is null or v.knowledge_base_id = any(p_knowledge_base_ids))
+        )
+        select
+            c.id,
+            c.knowledge_base_id,
+            c.content,
+            c.metadata,
+            1 - (c.embedding <=> query_embedding) as similarity
+        from candidates c
+        order by c.embedding <=> query_embedding
+        limit match_count;
+        return;
+    end if;
+
+    -- Settings are transaction-local, so they only apply to this call
+    if p_probes is not null then
+        perform set_config('ivfflat.probes', p_probes::text, true);
+    end if;
+    if p_ef_search is not null then
+        perform set_config('hnsw.ef_search', p_ef_search::text, true);
+    end if;
+
+    if p_half_precision then
+        return query
+        with candidates as materialized (
+            select v.id, v.knowledge_base_id, v.content, v.metadata, v.embedding
+            from saas_knowledge_base_vectors v
+            where v.user_id = p_user_id
+              and (p_knowledge_base_ids is null or v.knowledge_base_id = any(p_knowledge_base_ids))
+            order by v.embedding::halfvec(1536) <=> query_embedding::halfvec(1536)
+            limit match_count * p_rerank_factor
+        )
+        select
+            c.id,
+            c.knowledge_base_id,
+            c.content,
+            c.metadata,
+            1 - (c.embedding <=> query_embedding) as similarity
+        from candidates c
+        order by c.embedding <=> query_embedding
+        limit match_count;
+        return;
+    end if;
+
+    return query
+    select
+        v.id,
+        v.knowledge_base_id,
+        v.content,
+        v.metadata,
+        1 - (v.embedding <=> query_embedding) as similarity
+    from saas_knowledge_base_vectors v
+    where v.user_id = p_user_id
+      and (p_knowledge_base_ids is null or v.knowledge_base_id = any(p_knowledge_base_ids))
+    order by v.embedding <=> query_embedding
+    limit match_count;
+end;
+$$;
+
+-- Full-text side of hybrid retrieval, scoped like match_saas_knowledge_base_chunks.
+-- Any lexeme of the question may match (OR query), ranked by cover density, so
+-- a single product code or phone number is enough to surface a chunk.
+CREATE OR REPLACE FUNCTION search_saas_knowledge_base_chunks_text(
+    query_text TEXT,
+    p_user_id UUID,
+    p_knowledge_base_ids UUID[] DEFAULT NULL,
+    match_count int DEFAULT 10
+)
+RETURNS TABLE (
+    id UUID,
+    knowledge_base_id UUID,
+    content TEXT,
+    metadata JSONB,
+    rank REAL
+)
+LANGUAGE plpgsql
+AS $$
+declare
+    v_query tsquery;
+begin
+    select string_agg(quote_literal(lexeme), ' | ')::tsquery
+    into v_query
+    from unnest(tsvector_to_array(to_tsvector('english', query_text))) as lexeme;
+
+    if v_query is null then
+        return;
+    end if;
+
+    return query
+    select
+        v.id,
+        v.knowledge_base_id,
+        v.content,
+        v.metadata,
+        ts_rank_cd(v.content_tsv, v_query) as rank
+    from saas_knowledge_base_vectors v
+    where v.user_id = p_user_id
+      and (p_knowledge_base_ids is null or v.knowledge_base_id = any(p_knowledge_base_ids))
+      and v.content_tsv @@ v_query
+    order by ts_rank_cd(v.content_tsv, v_query) desc
+    limit match_count;
+end;
+$$;
+
+-- Embedding index maintenance (see backend/maintain_vector_index.py).
+-- The last build is recorded so the maintenance command can tell when the
+-- table has outgrown the index parameters.
+CREATE TABLE IF NOT EXISTS saas_vector_index_state (
+    index_name TEXT PRIMARY KEY,
+    method VARCHAR(20) NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}',
+    row_count BIGINT NOT NULL,
+    built_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION get_saas_vector_index_stats()
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    select jsonb_build_object(
+        'row_count', (select count(*) from saas_knowledge_base_vectors),
+        'index_definition', (
+            select indexdef from pg_indexes
+            where tablename = 'saas_knowledge_base_vectors'
+              and indexname = 'saas_knowledge_base_vectors_embedding_idx'
+        ),
+        'last_build', (
+            select to_jsonb(s) from saas_vector_index_state s
+            where s.index_name = 'saas_knowledge_base_vectors_embedding_idx'
+        )
+    );
+$$;
+
+-- Maintenance only: not callable with the anon/authenticated API keys
+REVOKE EXECUTE ON FUNCTION get_saas_vector_index_stats() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_saas_vector_index_stats() TO service_role;
+
+-- Rebuild the embedding index as ivfflat (p_lists) or hnsw (p_m, p_ef_construction).
+-- p_precision = 'half' indexes embedding::halfvec(1536) (pgvector 0.7+), which
+-- halves index size; the table keeps full-precision vectors for reranking.
+-- The new index is built under a temporary name and swapped in, so reads keep
+-- using the old one until the build finishes; writes wait for the build.
+DROP FUNCTION IF EXISTS rebuild_saas_vector_index(TEXT, int, int, int);
+CREATE OR REPLACE FUNCTION rebuild_saas_vector_index(
+    p_method TEXT,
+    p_lists int DEFAULT 100,
+    p_m int DEFAULT 16,
+    p_ef_construction int DEFAULT 64,
+    p_precision TEXT DEFAULT 'full'
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+declare
+    v_params JSONB;
+    v_rows BIGINT;
+    v_column TEXT;
+begin
+    if p_precision = 'half' then
+        v_column := '(embedding::halfvec(1536)) halfvec_cosine_ops';
+    elsif p_precision = 'full' then
+        v_column := 'embedding vector_cosine_ops';
+    else
+        raise exception 'Unknown vector index precision: %', p_precision;
+    end if;
+
+    if p_method = 'ivfflat' then
+        v_params := jsonb_build_object('lists', p_lists, 'precision', p_precision);
+        execute format(
+            'CREATE INDEX saas_knowledge_base_vectors_embedding_idx_new ON saas_knowledge_base_vectors '
+            'USING ivfflat (%s) WITH (lists = %s)', v_column, p_lists
+        );
+    elsif p_method = 'hnsw' then
+        v_params := jsonb_build_object('m', p_m, 'ef_construction', p_ef_construction, 'precision', p_precision);
+        execute format(
+            'CREATE INDEX saas_knowledge_base_vectors_embedding_idx_new ON saas_knowledge_base_vectors '
+            'USING hnsw (%s) WITH (m = %s, ef_construction = %s)', v_column, p_m, p_ef_construction
+        );
+    else
+        raise exception 'Unknown vector index method: %', p_method;
+    end if;
+
+    drop index if exists saas_knowledge_base_vectors_embedding_idx;
+    alter index saas_knowledge_base_vectors_embedding_idx_new rename to saas_knowledge_base_vectors_embedding_idx;
+
+    select count(*) into v_rows from saas_knowledge_base_vectors;
+    insert into saas_vector_index_state (index_name, method, params, row_count, built_at)
+    values ('saas_knowledge_base_vectors_embedding_idx', p_method, v_params, v_rows, now())
+    on conflict (index_name) do update
+        set method = excluded.method, params = excluded.params,
+            row_count = excluded.row_count, built_at = excluded.built_at;
+
+    return jsonb_build_object('method', p_method, 'params', v_params, 'row_count', v_rows);
+end;
+$$;
+
+-- SECURITY DEFINER and blocks writes while it runs: only the service role may call it
+REVOKE EXECUTE ON FUNCTION rebuild_saas_vector_index(TEXT, int, int, int, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_saas_vector_index(TEXT, int, int, int, TEXT) TO service_role;
+
+-- Everything the API needs to gate a user, in one round trip:
+-- client profile, active subscription with its plan, and active knowledge bases
+CREATE OR REPLACE FUNCTION get_saas_entitlements(p_user_id UUID)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    select jsonb_build_object(
+        'client_id', cp.id,
+        'subscription', (
+            select jsonb_build_object(
+                'id', s.id,
+                'status', s.status,
+                'start_date', s.start_date,
+                'end_date', s.end_date,
+                'saas_plans', coalesce(to_jsonb(p), '{}'::jsonb)
+            )
+            from saas_subscriptions s
+            left join saas_plans p on p.id = s.plan_id
+            where s.client_id = cp.id
+              and s.status = 'active'
+            order by s.end_date desc
+            limit 1
+        ),
+        'active_knowledge_base_ids', coalesce((
+            select jsonb_agg(kb.id)
+            from saas_knowledge_base kb
+            where kb.user_id = p_user_id
+              and kb.status = 'active'
+        ), '[]'::jsonb),
+        'active_url_count', (
+            select count(*)
+            from saas_knowledge_base kb
+            where kb.user_id = p_user_id
+              and kb.status = 'active'
+              and kb.type = 'url'
+        ),
+        'active_document_count', (
+            select count(*)
+            from saas_knowledge_base kb
+            where kb.user_id = p_user_id
+              and kb.status = 'active'
+              and kb.type = 'document'
+        )
+    )
+    from (select p_user_id as user_id) u
+    left join saas_client_profiles cp on cp.user_id = u.user_id
+    limit 1;
+$$;
+
 -- ================================================
 -- STRIPE INTEGRATION TABLES AND MODIFICATIONS
 -- ================================================
@@ -192,8 +514,13 @@ CREATE INDEX IF NOT EXISTS idx_payment_history_created_at ON saas_payment_histor
 
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_saas_users_email ON saas_users(email);
+CREATE INDEX IF NOT EXISTS idx_saas_client_profiles_user_id ON saas_client_profiles(user_id);
+CREATE INDEX IF NOT EXISTS idx_saas_subscriptions_client_status ON saas_subscriptions(client_id, status);
 CREATE INDEX IF NOT EXISTS idx_saas_knowledge_base_user_id ON saas_knowledge_base(user_id);
 CREATE INDEX IF NOT EXISTS idx_saas_knowledge_base_vectors_kb_id ON saas_knowledge_base_vectors(knowledge_base_id);
+CREATE INDEX IF NOT EXISTS idx_saas_knowledge_base_vectors_user_kb ON saas_knowledge_base_vectors(user_id, knowledge_base_id);
+CREATE INDEX IF NOT EXISTS idx_saas_knowledge_base_vectors_content_tsv ON saas_knowledge_base_vectors USING gin(content_tsv);
+CREATE INDEX IF NOT EXISTS idx_saas_knowledge_base_vectors_kb_source_url ON saas_knowledge_base_vectors(knowledge_base_id, (metadata->>'source_url'));
 CREATE INDEX IF NOT EXISTS idx_saas_chat_history_user_id ON saas_chat_history(user_id);
 
 -- Add updated_at trigger function
@@ -217,3 +544,6 @@ CREATE TRIGGER update_saas_subscriptions_updated_at BEFORE UPDATE ON saas_subscr
 
 CREATE TRIGGER update_saas_knowledge_base_updated_at BEFORE UPDATE ON saas_knowledge_base
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_saas_knowledge_base_pages_updated_at BEFORE UPDATE ON saas_knowledge_base_pages
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
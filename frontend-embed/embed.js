@@ -1,6 +1,8 @@
 // == Embed.js - Inject Chatbot Widget == //
 
 const chatHistory = [];
+// Identifies this conversation so the server can reuse its summary of earlier turns
+const chatSessionId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : String(Date.now()) + Math.random();
 
 (function () {
 
@@ -153,20 +155,48 @@ const chatHistory = [];
         showTyping();
 
         try {
-            const response = await fetch("http://localhost:8000/chat/public/ask", {
+            const response = await fetch("http://localhost:8000/chat/public/ask/stream", {
                 method: "POST",
                 headers: {"Content-Type": "application/json"},
                 body: JSON.stringify({
                     user_id: clientId,
                     message: msg,
                     chat_history: chatHistory,
+                    session_id: chatSessionId,
                 }),
             });
 
-            const data = await response.json();
+            if (!response.ok || !response.body) {
+                const data = await response.json().catch(() => ({}));
+                hideTyping();
+                appendMessage("bot", data.detail || "I'm sorry, I did not get that.");
+                return;
+            }
+
+            // Render tokens as they arrive over Server-Sent Events
+            let answer = "";
+            let botDiv = null;
+            await readEventStream(response, (event, data) => {
+                if (event === "token") {
+                    if (!botDiv) {
+                        hideTyping();
+                        botDiv = appendMessage("bot", "");
+                    }
+                    answer += data;
+                    botDiv.innerHTML = marked.parse(answer);
+                    chatBody.scrollTop = chatBody.scrollHeight;
+                } else if (event === "error") {
+                    answer = data.message;
+                }
+            });
+
             hideTyping();
-            const answer = data.response || "I'm sorry, I did not get that.";
-            appendMessage("bot", answer);
+            answer = answer || "I'm sorry, I did not get that.";
+            if (botDiv) {
+                botDiv.innerHTML = marked.parse(answer);
+            } else {
+                appendMessage("bot", answer);
+            }
             chatHistory.push(["user", msg], ["bot", answer]);
         } catch (err) {
             hideTyping();
@@ -174,6 +204,33 @@ const chatHistory = [];
         }
     };
 
+    // Parse a text/event-stream response body and call onEvent(event, data) per message
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = "message";
+                let data = "";
+                raw.split("\n").forEach(line => {
+                    if (line.startsWith("event:")) event = line.slice(6).trim();
+                    else if (line.startsWith("data:")) data += line.slice(5).trim();
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+
     function appendMessage(sender, text) {
         const msgDiv = document.createElement("div");
         msgDiv.className = sender === "bot" ? "bot-msg" : "user-msg";
@@ -181,6 +238,7 @@ const chatHistory = [];
         msgDiv.innerHTML = marked.parse(text);
         chatBody.appendChild(msgDiv);
         chatBody.scrollTop = chatBody.scrollHeight;
+        return msgDiv;
     }
 
     function showTyping() {